@@ -1,17 +1,31 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Query, Header
 from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, IndexModel, ReturnDocument
+from pymongo.errors import OperationFailure, BulkWriteError, DuplicateKeyError
 import os
 import logging
 import asyncio
 import json
+import base64
+import csv
+import gzip
+import hashlib
+import html
+import io
+import re
+import zlib
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
@@ -20,7 +34,7 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Security: JWT_SECRET must be set in environment - no fallback for production
@@ -31,14 +45,123 @@ if not JWT_SECRET:
 DISCORD_BOT_TOKEN = os.environ.get('DISCORD_BOT_TOKEN', '')
 SUPPORT_ROLE_IDS = os.environ.get('SUPPORT_ROLE_IDS', '').split(',')
 
+# Live event fan-out between uvicorn workers / hosts: redis, mongo (change streams, needs a replica set) or memory
+REDIS_URL = os.environ.get('REDIS_URL', '')
+EVENT_BUS_BACKEND = os.environ.get('EVENT_BUS', 'redis' if REDIS_URL else 'memory')
+EVENT_BUS_CHANNEL = os.environ.get('EVENT_BUS_CHANNEL', 'ccx:live_events')
+
+# Per-client SSE buffering: bounded queue, coalescing of repeated events, eviction of stalled consumers
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', '100'))
+SSE_OVERFLOW_POLICY = os.environ.get('SSE_OVERFLOW_POLICY', 'drop_oldest')  # drop_oldest | disconnect
+SSE_MAX_DROPPED = int(os.environ.get('SSE_MAX_DROPPED', '200'))
+SSE_COALESCE_EVENTS = {e for e in os.environ.get('SSE_COALESCE_EVENTS', 'notes_update,ticket_message').split(',') if e}
+# Only sent to streams opened for one ticket (/events?ticket_id=); the global feed has message_batch
+SSE_TICKET_ONLY_EVENTS = {"ticket_message"}
+
+# Last-Event-ID replay: recent events kept in memory, older ones read back from live_events
+SSE_REPLAY_BUFFER = int(os.environ.get('SSE_REPLAY_BUFFER', '1000'))
+SSE_REPLAY_LIMIT = int(os.environ.get('SSE_REPLAY_LIMIT', '500'))
+
+KPI_CACHE_TTL = float(os.environ.get('KPI_CACHE_TTL', '10'))
+SETTINGS_CACHE_TTL = float(os.environ.get('SETTINGS_CACHE_TTL', '60'))
+
+# Verified JWTs are cached by hash; revoked users are reloaded from the database at least this often
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', '60'))
+TOKEN_LIFETIME = timedelta(hours=24)
+
+# bcrypt runs in a small thread pool (it releases the GIL); beyond PASSWORD_MAX_PENDING queued calls
+# logins are refused instead of piling up. Login attempts are limited per username and per client IP.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_MAX_PENDING = int(os.environ.get('PASSWORD_MAX_PENDING', '16'))
+LOGIN_LIMIT_PER_USER = int(os.environ.get('LOGIN_LIMIT_PER_USER', '10'))
+LOGIN_LIMIT_PER_IP = int(os.environ.get('LOGIN_LIMIT_PER_IP', '30'))
+LOGIN_LIMIT_WINDOW = float(os.environ.get('LOGIN_LIMIT_WINDOW', '60'))
+
+# audit_log / live_events inserts are buffered and written in batches off the request path
+WRITE_BEHIND_DURABILITY = os.environ.get('WRITE_BEHIND_DURABILITY', 'buffered')  # buffered | sync
+WRITE_BEHIND_BATCH = int(os.environ.get('WRITE_BEHIND_BATCH', '200'))
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', '0.5'))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '10000'))
+
+BOT_BATCH_MAX_ITEMS = int(os.environ.get('BOT_BATCH_MAX_ITEMS', '500'))
+BOT_EVENT_KEY_TTL_HOURS = float(os.environ.get('BOT_EVENT_KEY_TTL_HOURS', '72'))
+COUNTER_REQUEST_HISTORY = int(os.environ.get('COUNTER_REQUEST_HISTORY', '100'))
+
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '500'))
+ESTIMATED_COUNT_CAP = int(os.environ.get('ESTIMATED_COUNT_CAP', '10000'))
+
+# Startup drops indexes of catalogued collections that INDEX_CATALOGUE no longer lists
+INDEX_RECONCILE = os.environ.get('INDEX_RECONCILE', 'true').lower() == 'true'
+
+# SLA engine: one worker holds the lease and checks tickets whose sla_due_at has passed
+SLA_ENGINE_INTERVAL = float(os.environ.get('SLA_ENGINE_INTERVAL', '30'))
+SLA_ENGINE_BATCH = int(os.environ.get('SLA_ENGINE_BATCH', '500'))
+SLA_LEASE_SECONDS = float(os.environ.get('SLA_LEASE_SECONDS', '90'))
+
+# Closed tickets are archived as gzip HTML + NDJSON transcripts; optionally their messages are then
+# removed from ticket_messages
+TRANSCRIPT_DIR = Path(os.environ.get('TRANSCRIPT_DIR', str(ROOT_DIR / 'transcripts')))
+TRANSCRIPT_BATCH = int(os.environ.get('TRANSCRIPT_BATCH', '500'))
+TRANSCRIPT_PURGE_MESSAGES = os.environ.get('TRANSCRIPT_PURGE_MESSAGES', 'false').lower() == 'true'
+
+# Timestamps written as ISO strings by older versions are converted to BSON dates in the background
+DATETIME_MIGRATION_BATCH = int(os.environ.get('DATETIME_MIGRATION_BATCH', '500'))
+DATETIME_MIGRATION_PAUSE = float(os.environ.get('DATETIME_MIGRATION_PAUSE', '0.05'))
+
+# Retention: live_events expire after LIVE_EVENTS_TTL_DAYS; audit entries live in monthly partitions and
+# partitions older than AUDIT_RETENTION_MONTHS are archived to AUDIT_ARCHIVE_DIR and dropped (0 keeps all)
+LIVE_EVENTS_TTL_DAYS = float(os.environ.get('LIVE_EVENTS_TTL_DAYS', '7'))
+AUDIT_RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS', '6'))
+AUDIT_ARCHIVE_DIR = Path(os.environ.get('AUDIT_ARCHIVE_DIR', str(ROOT_DIR / 'archive')))
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', '3600'))
+RETENTION_BATCH = int(os.environ.get('RETENTION_BATCH', '1000'))
+
+EXPORT_BATCH = int(os.environ.get('EXPORT_BATCH', '1000'))
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# SSE event queues
+# Long-running tasks started at startup, cancelled at shutdown
+background_tasks: set = set()
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# --- Timestamps ---
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Timestamps are stored as BSON dates and read back as aware UTC datetimes. Until the datetime
+# migration has finished, older documents may still hold ISO strings.
+def parse_time(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def as_iso(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else (value or "")
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def time_cond(field: str, op: str, value: datetime) -> dict:
+    # Match both representations while unconverted string timestamps may remain
+    if datetime_migration.done:
+        return {field: {op: value}}
+    return {"$or": [{field: {op: value}}, {field: {op: value.isoformat()}}]}
+
+# Connected SSE clients of this worker
 sse_clients: list = []
+recent_events: deque = deque(maxlen=SSE_REPLAY_BUFFER)
 
 # --- Pydantic Models ---
 class LoginRequest(BaseModel):
@@ -53,6 +176,7 @@ class TicketUpdate(BaseModel):
     notes: Optional[str] = None
     priority: Optional[str] = None
     status: Optional[str] = None
+    version: Optional[int] = None
 
 class CreateUserRequest(BaseModel):
     username: str
@@ -73,30 +197,181 @@ class BotTicketCreate(BaseModel):
 class BotEventCreate(BaseModel):
     event_type: str
     data: dict
+    id: Optional[str] = None
 
-# --- Auth Helpers ---
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+class BotMessageCreate(BaseModel):
+    ticket_id: str
+    author: str
+    author_id: str
+    content: str = ""
+    timestamp: Optional[datetime] = None
+    attachments: List[str] = []
+    id: Optional[str] = None
+
+class BotMessageBatch(BaseModel):
+    items: List[BotMessageCreate] = Field(..., max_length=BOT_BATCH_MAX_ITEMS)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+class BotEventBatch(BaseModel):
+    items: List[BotEventCreate] = Field(..., max_length=BOT_BATCH_MAX_ITEMS)
+
+class BotStateTicket(BaseModel):
+    user_id: str
+    open: bool = True
+    data: dict
+
+class BotStateUser(BaseModel):
+    last_ticket_at: Optional[str] = None
+
+class BotStateCounter(BaseModel):
+    increment: int = 0
+    seed: int = 0
+    # Set by the bot per increment, so a retry whose first response was lost is not applied twice
+    request_id: Optional[str] = None
+
+# --- Auth Helpers ---
+password_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_pending = 0
+
+async def run_password_work(fn, *args):
+    global password_pending
+    if password_pending >= PASSWORD_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Too many concurrent logins, try again shortly")
+    password_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_pool, fn, *args)
+    finally:
+        password_pending -= 1
+
+async def hash_password(password: str) -> str:
+    hashed = await run_password_work(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt())
+    return hashed.decode('utf-8')
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await run_password_work(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+# Sliding-window attempt counter per key, kept per worker
+class RateLimiter:
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.attempts: OrderedDict = OrderedDict()
+
+    def hit(self, key: str) -> float:
+        now = time.monotonic()
+        attempts = self.attempts.pop(key, None) or deque()
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        self.attempts[key] = attempts
+        if len(self.attempts) > self.max_keys:
+            self.attempts.popitem(last=False)
+        if len(attempts) >= self.limit:
+            return attempts[0] + self.window - now
+        attempts.append(now)
+        return 0.0
+
+login_user_limiter = RateLimiter(LOGIN_LIMIT_PER_USER, LOGIN_LIMIT_WINDOW)
+login_ip_limiter = RateLimiter(LOGIN_LIMIT_PER_IP, LOGIN_LIMIT_WINDOW)
+
+def client_ip(request: Request) -> str:
+    host = request.client.host if request.client else ""
+    # Only the local nginx is trusted to report the real client address
+    if host in ("127.0.0.1", "::1"):
+        return request.headers.get("X-Real-IP", host)
+    return host
 
 def create_token(user_id: str, username: str, role: str) -> str:
     payload = {
         "sub": user_id,
         "username": username,
         "role": role,
-        "exp": datetime.now(timezone.utc) + timedelta(hours=24)
+        "exp": datetime.now(timezone.utc) + TOKEN_LIFETIME
     }
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        for key in [k for k, v in self.entries.items() if predicate(v)]:
+            del self.entries[key]
+
+# Payloads of tokens that already passed signature verification, keyed by sha256 of the token.
+# Callers share the cached dict and must not modify it.
+token_cache = LRUCache(TOKEN_CACHE_SIZE)
+# /auth/me profiles by user id, dropped together with the user's tokens on revocation
+profile_cache = LRUCache(TOKEN_CACHE_SIZE)
+
+# Users whose tokens must stop working before they expire (deleted accounts). Stored in revoked_users
+# until the last token they could hold has expired, and announced as user_revoked so every worker
+# drops them at once; the periodic reload covers buses that don't span workers.
+class RevocationList:
+    def __init__(self, refresh: float):
+        self.refresh = refresh
+        self.users: set = set()
+        self.loaded_at = 0.0
+        self.reloading = None
+
+    def is_revoked(self, user_id: str) -> bool:
+        if time.monotonic() - self.loaded_at > self.refresh and (self.reloading is None or self.reloading.done()):
+            self.reloading = spawn(self.load())
+        return user_id in self.users
+
+    async def load(self):
+        docs = await db.revoked_users.find({"expires_at": {"$gt": datetime.now(timezone.utc)}}, {"_id": 0, "user_id": 1}).to_list(None)
+        self.users = {d["user_id"] for d in docs}
+        self.loaded_at = time.monotonic()
+
+    def add(self, user_id: str):
+        self.users.add(user_id)
+        token_cache.discard_where(lambda payload: payload.get("sub") == user_id)
+        profile_cache.pop(user_id)
+
+    async def revoke(self, user_id: str):
+        await db.revoked_users.update_one(
+            {"user_id": user_id},
+            {"$set": {"expires_at": datetime.now(timezone.utc) + TOKEN_LIFETIME}},
+            upsert=True
+        )
+        self.add(user_id)
+        await push_event("user_revoked", {"user_id": user_id})
+
+revocations = RevocationList(REVOCATION_REFRESH_SECONDS)
+
 def decode_token(token: str) -> dict:
-    try:
-        return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-    except jwt.ExpiredSignatureError:
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        token_cache.put(key, payload)
+    elif payload["exp"] <= time.time():
+        token_cache.pop(key)
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    if revocations.is_revoked(payload["sub"]):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return payload
 
 async def get_current_user(request: Request) -> dict:
     auth = request.headers.get("Authorization", "")
@@ -115,23 +390,389 @@ async def require_support(user: dict = Depends(get_current_user)) -> dict:
         raise HTTPException(status_code=403, detail="Support role required")
     return user
 
+# --- Caching ---
+# Events that change ticket documents; every worker drops its ticket-derived caches when it sees one
+TICKET_EVENT_TYPES = {"ticket_open", "ticket_claim", "ticket_close", "ticket_reopen", "escalation", "notes_update", "ticket_update", "sla_breach"}
+
+class TTLCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries: dict = {}
+        self.generation = 0
+        self.lock = asyncio.Lock()
+
+    def _fresh(self, key):
+        entry = self.entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            return entry
+        return None
+
+    async def get_or_compute(self, key, compute):
+        entry = self._fresh(key)
+        if entry:
+            return entry[0]
+        # One computation per key at a time; concurrent callers wait and reuse it
+        async with self.lock:
+            entry = self._fresh(key)
+            if entry:
+                return entry[0]
+            generation = self.generation
+            value = await compute()
+            if generation == self.generation:
+                self.entries[key] = (value, time.monotonic() + self.ttl)
+            return value
+
+    def invalidate(self):
+        self.generation += 1
+        self.entries.clear()
+
+kpi_cache = TTLCache(KPI_CACHE_TTL)
+
+def invalidate_ticket_caches():
+    kpi_cache.invalidate()
+
+# --- Event Bus ---
+# push_events publishes a list of events as one bus message; every worker subscribes once and hands
+# each received list to deliver_events, which fans it out to its own SSE clients.
+class MemoryEventBus:
+    persists_events = False
+
+    def __init__(self):
+        self.handler = None
+
+    async def start(self, handler):
+        self.handler = handler
+
+    async def publish(self, events: list):
+        await self.handler(events)
+
+    async def stop(self):
+        pass
+
+class RedisEventBus:
+    persists_events = False
+
+    def __init__(self, url: str, channel: str):
+        self.url = url
+        self.channel = channel
+        self.handler = None
+        self.redis = None
+        self.task = None
+
+    async def start(self, handler):
+        import redis.asyncio as aioredis
+        self.handler = handler
+        self.redis = aioredis.from_url(self.url)
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        self.task = asyncio.create_task(self._listen(pubsub))
+
+    async def _listen(self, pubsub):
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        await self.handler(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                logger.error(f"Redis event bus subscription failed: {e}")
+                await asyncio.sleep(1)
+                try:
+                    await pubsub.aclose()
+                    pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                    await pubsub.subscribe(self.channel)
+                except Exception as e:
+                    logger.error(f"Redis event bus resubscribe failed: {e}")
+
+    async def publish(self, events: list):
+        try:
+            await self.redis.publish(self.channel, json.dumps(events, default=json_default))
+        except Exception as e:
+            # Redis unavailable: at least this worker's dashboards get the events
+            logger.error(f"Redis publish failed, delivering locally: {e}")
+            await self.handler(events)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.redis:
+            await self.redis.aclose()
+
+class MongoEventBus:
+    # The insert into live_events is the publish; every worker tails the change stream.
+    persists_events = True
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.handler = None
+        self.task = None
+
+    async def start(self, handler):
+        self.handler = handler
+        stream = self.collection.watch([{"$match": {"operationType": "insert"}}])
+        self.task = asyncio.create_task(self._listen(stream))
+
+    async def _listen(self, stream):
+        resume_token = None
+        while True:
+            try:
+                async with stream:
+                    async for change in stream:
+                        resume_token = change["_id"]
+                        event = change["fullDocument"]
+                        event.pop("_id", None)
+                        await self.handler([event])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mongo change stream failed: {e}")
+                await asyncio.sleep(1)
+            stream = self.collection.watch([{"$match": {"operationType": "insert"}}], resume_after=resume_token)
+
+    async def publish(self, events: list):
+        await self.collection.insert_many([{**event} for event in events])
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+def create_event_bus(backend: str):
+    if backend == "redis":
+        return RedisEventBus(REDIS_URL or "redis://localhost:6379/0", EVENT_BUS_CHANNEL)
+    if backend == "mongo":
+        return MongoEventBus(db.live_events)
+    if backend != "memory":
+        raise ValueError(f"Unknown EVENT_BUS backend: {backend}")
+    return MemoryEventBus()
+
+event_bus = create_event_bus(EVENT_BUS_BACKEND)
+
+# --- Write-Behind Persistence ---
+class WriteBehindBuffer:
+    def __init__(self, route):
+        # route(doc) -> collection name the document belongs in
+        self.route = route
+        self.pending: list = []
+        self.wakeup = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.task = None
+        self.stopping = False
+        self.written = 0
+
+    async def add(self, doc: dict):
+        if WRITE_BEHIND_DURABILITY == "sync" or self.task is None:
+            await self._write([doc])
+            return
+        if len(self.pending) >= WRITE_BEHIND_MAX_PENDING:
+            # Backpressure: once the buffer is full the caller pays for its own write
+            await self._write([doc])
+            return
+        self.pending.append(doc)
+        if len(self.pending) >= WRITE_BEHIND_BATCH:
+            self.wakeup.set()
+
+    async def _write(self, docs: list):
+        by_collection = {}
+        for doc in docs:
+            by_collection.setdefault(self.route(doc), []).append(doc)
+        for collection, batch in by_collection.items():
+            try:
+                await db[collection].insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # A retried batch keeps its _ids; documents stored by the failed attempt are duplicates
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+        self.written += len(docs)
+
+    async def flush(self):
+        async with self.flush_lock:
+            while self.pending:
+                batch = self.pending[:WRITE_BEHIND_BATCH]
+                del self.pending[:WRITE_BEHIND_BATCH]
+                try:
+                    await self._write(batch)
+                except Exception:
+                    self.pending[:0] = batch
+                    raise
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=WRITE_BEHIND_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed, {len(self.pending)} documents pending: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if not self.task:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        await self.task
+        self.task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # Shutdown continues; what could not be written is lost with the process
+            logger.error(f"Write-behind flush at shutdown failed, {len(self.pending)} documents dropped: {e}")
+
+audit_buffer = WriteBehindBuffer(lambda doc: audit_partition(doc["timestamp"]))
+event_buffer = WriteBehindBuffer(lambda doc: "live_events")
+
 # --- SSE Helper ---
-async def push_event(event_type: str, data: dict):
-    event_data = {
-        "id": str(uuid.uuid4()),
+# Event ids sort in publish order: zero-padded epoch millis, a per-process sequence and a process tag.
+_event_node = uuid.uuid4().hex[:6]
+_event_clock = [0, 0]  # last millis, sequence
+
+def next_event_id(now: datetime) -> str:
+    ms = int(now.timestamp() * 1000)
+    if ms <= _event_clock[0]:
+        ms = _event_clock[0]
+        _event_clock[1] += 1
+    else:
+        _event_clock[0], _event_clock[1] = ms, 0
+    return f"{ms:013d}-{_event_clock[1]:06d}-{_event_node}"
+
+def event_id_time(event_id: str) -> Optional[datetime]:
+    try:
+        return datetime.fromtimestamp(int(event_id.split("-", 1)[0]) / 1000, tz=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+async def push_events(events: list):
+    # events: (event_type, data) pairs, persisted and published together
+    now = datetime.now(timezone.utc)
+    docs = [{
+        "id": next_event_id(now),
         "event_type": event_type,
         "data": data,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
-    await db.live_events.insert_one({**event_data})
-    dead = []
-    for q in sse_clients:
-        try:
-            await q.put(event_data)
-        except Exception:
-            dead.append(q)
-    for q in dead:
-        sse_clients.remove(q)
+        "timestamp": now
+    } for event_type, data in events]
+    if not docs:
+        return
+    if not event_bus.persists_events:
+        for doc in docs:
+            await event_buffer.add({**doc})
+    await event_bus.publish(docs)
+
+async def push_event(event_type: str, data: dict):
+    await push_events([(event_type, data)])
+
+class SSEClient:
+    def __init__(self, maxsize: int = SSE_QUEUE_SIZE, ticket_id: Optional[str] = None, user_id: Optional[str] = None):
+        self.id = str(uuid.uuid4())
+        self.maxsize = maxsize
+        self.ticket_id = ticket_id
+        self.user_id = user_id
+        self.buffer: OrderedDict = OrderedDict()  # key -> (enqueued_at, event)
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.connected_at = datetime.now(timezone.utc).isoformat()
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.dropped_since_read = 0
+        self.max_queued = 0
+
+    def wants(self, event: dict) -> bool:
+        if self.ticket_id is None:
+            return event.get("event_type") not in SSE_TICKET_ONLY_EVENTS
+        return (event.get("data") or {}).get("ticket_id") == self.ticket_id
+
+    def offer(self, event: dict):
+        # Never blocks: a full queue costs the client events, not the publisher time
+        if self.closed:
+            return
+        if event.get("event_type") == "user_revoked" and self.user_id and (event.get("data") or {}).get("user_id") == self.user_id:
+            # A revoked user's open stream ends with their tokens
+            self.close()
+            return
+        if not self.wants(event):
+            return
+        key = event.get("id")
+        if event.get("event_type") in SSE_COALESCE_EVENTS:
+            key = (event["event_type"], (event.get("data") or {}).get("ticket_id"))
+            if self.buffer.pop(key, None) is not None:
+                self.coalesced += 1
+        if len(self.buffer) >= self.maxsize:
+            if SSE_OVERFLOW_POLICY == "disconnect":
+                self.close()
+                return
+            self.buffer.popitem(last=False)
+            self.dropped += 1
+            self.dropped_since_read += 1
+            if self.dropped_since_read >= SSE_MAX_DROPPED:
+                self.close()
+                return
+        self.buffer[key] = (time.monotonic(), event)
+        self.max_queued = max(self.max_queued, len(self.buffer))
+        self.ready.set()
+
+    async def get(self, timeout: float):
+        if not self.buffer:
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        if not self.buffer:
+            return None
+        _, (_, event) = self.buffer.popitem(last=False)
+        self.delivered += 1
+        self.dropped_since_read = 0
+        return event
+
+    def close(self):
+        self.closed = True
+        self.buffer.clear()
+        self.ready.set()
+
+    def metrics(self) -> dict:
+        oldest = next(iter(self.buffer.values()))[0] if self.buffer else None
+        return {
+            "id": self.id,
+            "ticket_id": self.ticket_id,
+            "connected_at": self.connected_at,
+            "queued": len(self.buffer),
+            "max_queued": self.max_queued,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "lag_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0
+        }
+
+async def deliver_events(events: list):
+    if any(e.get("event_type") in TICKET_EVENT_TYPES for e in events):
+        invalidate_ticket_caches()
+    for e in events:
+        if e.get("event_type") == "settings_update":
+            settings_cache.notify(e["data"].get("version", 0))
+        elif e.get("event_type") == "user_revoked":
+            revocations.add(e["data"]["user_id"])
+    recent_events.extend(events)
+    for sse_client in list(sse_clients):
+        for event_data in events:
+            sse_client.offer(event_data)
+        if sse_client.closed:
+            logger.warning(f"Evicting slow SSE client {sse_client.id} (dropped {sse_client.dropped} events)")
+            sse_clients.remove(sse_client)
 
 async def audit_log(action: str, user: str, target_ticket: str = None, details: str = ""):
     doc = {
@@ -140,15 +781,732 @@ async def audit_log(action: str, user: str, target_ticket: str = None, details:
         "user": user,
         "target_ticket": target_ticket,
         "details": details,
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": datetime.now(timezone.utc)
+    }
+    await audit_buffer.add(doc)
+
+# --- Analytics Rollups ---
+# ticket_rollups holds counters per day, close day, priority, type and supporter, plus the totals the KPI
+# tiles show. Each ticket write applies the difference between the ticket's contribution before and after
+# it, so analytics reads are O(keys). Bump ROLLUP_VERSION when contributions change; startup then rebuilds.
+ROLLUP_VERSION = 2
+OPEN_STATUSES = ("open", "claimed", "escalated")
+
+def rollup_day(value) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%d")
+    if isinstance(value, str):
+        return value[:10]
+    return None
+
+def rollup_response_ms(ticket: dict) -> Optional[int]:
+    try:
+        responded, claimed = parse_time(ticket.get("first_response_at")), parse_time(ticket.get("claimed_at"))
+    except ValueError:
+        return None
+    if responded is None or claimed is None:
+        return None
+    return int((responded - claimed).total_seconds() * 1000)
+
+def rollup_contribution(ticket: Optional[dict]) -> dict:
+    if not ticket:
+        return {}
+    closed = 1 if ticket.get("status") == "closed" else 0
+    breached = 1 if ticket.get("sla_breached") else 0
+    totals = {
+        "tickets": 1,
+        "breached": breached,
+        "open": 1 if ticket.get("status") in OPEN_STATUSES else 0,
+        "escalated": 1 if ticket.get("status") == "escalated" else 0,
+        "open_breached": breached * (1 - closed),
     }
-    await db.audit_log.insert_one(doc)
+    response_ms = rollup_response_ms(ticket)
+    if response_ms is not None:
+        totals.update(responded=1, response_ms=response_ms)
+    contribution = {
+        ("total", "all"): totals,
+        ("priority", ticket.get("priority")): {"total": 1, "breached": breached},
+        ("type", ticket.get("type")): {"count": 1},
+    }
+    day = rollup_day(ticket.get("created_at"))
+    if day:
+        contribution[("day", day)] = {"opened": 1, "closed": closed, "breached": breached}
+    closed_day = rollup_day(ticket.get("closed_at")) if closed else None
+    if closed_day:
+        contribution[("closed", closed_day)] = {"count": 1}
+    if ticket.get("claimed_by"):
+        contribution[("supporter", ticket["claimed_by"])] = {
+            "total": 1,
+            "closed": closed,
+            "escalations": 1 if ticket.get("escalation_flag") else 0,
+            "sla_breaches": breached
+        }
+    return contribution
+
+def rollup_delta(before: Optional[dict], after: Optional[dict]) -> dict:
+    delta = {}
+    for sign, ticket in ((-1, before), (1, after)):
+        for key, counters in rollup_contribution(ticket).items():
+            entry = delta.setdefault(key, {})
+            for field, n in counters.items():
+                entry[field] = entry.get(field, 0) + sign * n
+    return {key: {f: n for f, n in counters.items() if n} for key, counters in delta.items() if any(counters.values())}
+
+def rollup_ops(delta: dict) -> list:
+    return [
+        UpdateOne({"_id": f"{kind}:{key}"}, {"$inc": counters, "$setOnInsert": {"kind": kind, "key": key, "version": ROLLUP_VERSION}},
+                  upsert=True)
+        for (kind, key), counters in delta.items()
+    ]
+
+async def apply_rollups(before: Optional[dict], after: Optional[dict]):
+    ops = rollup_ops(rollup_delta(before, after))
+    if ops:
+        await db.ticket_rollups.bulk_write(ops, ordered=False)
+
+rollups_rebuild_lock = asyncio.Lock()
+
+async def rebuild_rollups() -> Optional[int]:
+    # Backfill: one streaming pass over tickets into a scratch collection, then swap it in. Only the
+    # lease holder rebuilds (None means another worker is at it), and each run has its own scratch
+    # collection. Ticket writes landing between the scan and the swap update the old collection and
+    # are lost, so the rebuild is a repair tool for quiet periods; startup only runs it while
+    # ticket_rollups is still empty or was built for an older ROLLUP_VERSION. The lease is held per worker; the lock keeps out a second
+    # rebuild in the same worker.
+    if rollups_rebuild_lock.locked():
+        return None
+    async with rollups_rebuild_lock:
+        if not await acquire_lease("rollups_rebuild", SLA_LEASE_SECONDS):
+            return None
+        return await build_rollups()
+
+async def build_rollups() -> int:
+    scratch = db[f"ticket_rollups_rebuild_{_event_node}_{uuid.uuid4().hex[:8]}"]
+    try:
+        totals = {}
+        count = 0
+        fields = {"_id": 0, "status": 1, "sla_breached": 1, "priority": 1, "type": 1, "created_at": 1, "claimed_by": 1,
+                  "escalation_flag": 1, "closed_at": 1, "claimed_at": 1, "first_response_at": 1}
+        async for ticket in db.tickets.find({}, fields).batch_size(1000):
+            count += 1
+            if count % 10000 == 0:
+                await acquire_lease("rollups_rebuild", SLA_LEASE_SECONDS)
+            for key, counters in rollup_contribution(ticket).items():
+                entry = totals.setdefault(key, {})
+                for field, n in counters.items():
+                    entry[field] = entry.get(field, 0) + n
+        docs = [{"_id": f"{kind}:{key}", "kind": kind, "key": key, "version": ROLLUP_VERSION, **counters}
+                for (kind, key), counters in totals.items()]
+        if docs:
+            await scratch.insert_many(docs)
+            await scratch.rename("ticket_rollups", dropTarget=True)
+        else:
+            await db.ticket_rollups.delete_many({})
+        await db.ticket_rollups.create_index([("kind", 1), ("key", 1)])
+    finally:
+        await scratch.drop()
+        await release_lease("rollups_rebuild")
+    invalidate_ticket_caches()
+    return count
+
+async def get_rollups(kind: str, since: Optional[str] = None) -> list:
+    query = {"kind": kind}
+    if since:
+        query["key"] = {"$gte": since}
+    return await db.ticket_rollups.find(query, {"_id": 0}).sort("key", 1).to_list(None)
+
+# --- Ticket State Machine ---
+# Each transition is one find_one_and_update whose filter encodes the allowed from-states (and,
+# optionally, the version the client last saw). No match means 404 or a 409 conflict, unless the
+# ticket is already in the target state: retries and outbox replays then get (None, current ticket).
+TICKET_STATUSES = {"open", "claimed", "closed", "escalated"}
+TICKET_PRIORITIES = {"low", "medium", "high", "critical"}
+TRANSITIONS = {
+    "claim": ("open", "escalated"),
+    "close": ("open", "claimed", "escalated"),
+    "reopen": ("closed",),
+    "escalate": ("open", "claimed"),
+}
+
+async def transition_ticket(ticket_id: str, allowed_from: Optional[tuple], set_fields: dict,
+                            set_if_null: Optional[dict] = None, expected_version: Optional[int] = None,
+                            also_from: Optional[dict] = None, target: Optional[dict] = None):
+    query = {"id": ticket_id}
+    if allowed_from is not None:
+        from_status = {"status": {"$in": list(allowed_from)}}
+        if also_from:
+            query["$or"] = [from_status, also_from]
+        else:
+            query.update(from_status)
+    if expected_version is not None:
+        query["version"] = expected_version if expected_version else {"$in": [0, None]}
+    # Pipeline update so set_if_null is decided server-side; values are $literal so user text is never an expression
+    stage = {field: {"$literal": value} for field, value in set_fields.items()}
+    for field, value in (set_if_null or {}).items():
+        stage[field] = {"$ifNull": [f"${field}", {"$literal": value}]}
+    stage["version"] = {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+    before = await db.tickets.find_one_and_update(query, [{"$set": stage}], projection=TICKET_PROJECTION,
+                                                  return_document=ReturnDocument.BEFORE)
+    if before is None:
+        current = await db.tickets.find_one({"id": ticket_id}, TICKET_PROJECTION)
+        if not current:
+            raise HTTPException(status_code=404, detail="Ticket not found")
+        if target and all(current.get(field) == value for field, value in target.items()):
+            return None, current
+        if expected_version is not None and (current.get("version") or 0) != expected_version:
+            raise HTTPException(status_code=409, detail=f"Ticket was modified (version {current.get('version') or 0})")
+        raise HTTPException(status_code=409, detail=f"Ticket is {current.get('status')}")
+    after = {**before, **set_fields, "version": (before.get("version") or 0) + 1}
+    for field, value in (set_if_null or {}).items():
+        if before.get(field) is None:
+            after[field] = value
+    await apply_rollups(before, after)
+    return before, after
+
+# --- Leader Election ---
+# A lease document per job; the holder renews it every run and other workers take over once it expires
+async def acquire_lease(name: str, ttl: float) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        lease = await db.leases.find_one_and_update(
+            {"_id": name, "$or": [{"owner": _event_node}, {"expires_at": {"$lt": now}},
+                                      {"expires_at": {"$not": {"$type": "date"}}}]},
+            {"$set": {"owner": _event_node, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease
+        return False
+    return lease is not None
+
+async def release_lease(name: str):
+    await db.leases.delete_one({"_id": name, "owner": _event_node})
+
+# --- Datetime Migration ---
+# Older versions stored timestamps as ISO strings. The lease holder converts them to BSON dates in
+# throttled batches while the API keeps serving; queries match both forms until the migration has
+# recorded itself as done, which every worker picks up within DATETIME_MIGRATION_RECHECK seconds.
+DATETIME_FIELDS = {
+    "tickets": ["created_at", "claimed_at", "first_response_at", "closed_at", "reopened_at", "sla_due_at", "transcript_created_at"],
+    "ticket_messages": ["timestamp"],
+    "live_events": ["timestamp"],
+    "audit_log": ["timestamp"],
+    "panel_users": ["created_at"],
+    "bot_tickets": ["updated_at"],
+}
+DATETIME_MIGRATION_RECHECK = 60
+
+async def convert_timestamps(collection: str, field: str, query: Optional[dict] = None) -> int:
+    # Walks _id upwards so every batch starts where the previous one stopped
+    converted, last_id = 0, None
+    while True:
+        batch_query = {**(query or {}), field: {"$type": "string"}}
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        docs = await db[collection].find(batch_query, {"_id": 1, field: 1}) \
+            .sort("_id", 1).limit(DATETIME_MIGRATION_BATCH).to_list(DATETIME_MIGRATION_BATCH)
+        if not docs:
+            return converted
+        ops = []
+        for doc in docs:
+            try:
+                value = parse_time(doc[field])
+            except ValueError:
+                value = None
+            # Matching the old value leaves documents rewritten in the meantime alone
+            ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        result = await db[collection].bulk_write(ops, ordered=False)
+        converted += result.modified_count
+        last_id = docs[-1]["_id"]
+        if len(docs) < DATETIME_MIGRATION_BATCH:
+            return converted
+        await asyncio.sleep(DATETIME_MIGRATION_PAUSE)
+
+class DatetimeMigration:
+    name = "bson_datetimes"
+
+    def __init__(self):
+        self._done = False
+        self.checked_at = 0.0
+
+    @property
+    def done(self) -> bool:
+        if not self._done and time.monotonic() - self.checked_at > DATETIME_MIGRATION_RECHECK:
+            self.checked_at = time.monotonic()
+            spawn(self.load())
+        return self._done
+
+    async def load(self):
+        self.checked_at = time.monotonic()
+        self._done = await db.migrations.find_one({"_id": self.name, "done_at": {"$ne": None}}) is not None
+
+    async def run(self):
+        while not self._done:
+            try:
+                if await acquire_lease(self.name, SLA_LEASE_SECONDS):
+                    total = 0
+                    for collection, fields in DATETIME_FIELDS.items():
+                        for field in fields:
+                            await acquire_lease(self.name, SLA_LEASE_SECONDS)
+                            converted = await convert_timestamps(collection, field)
+                            if converted:
+                                logger.info(f"Converted {converted} {collection}.{field} values to BSON dates")
+                            total += converted
+                    await db.migrations.update_one({"_id": self.name},
+                                                   {"$set": {"done_at": datetime.now(timezone.utc), "converted": total}}, upsert=True)
+                    await release_lease(self.name)
+                    self._done = True
+                    break
+                await asyncio.sleep(SLA_ENGINE_INTERVAL)
+                await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Datetime migration failed: {e}")
+                await asyncio.sleep(SLA_ENGINE_INTERVAL)
+
+datetime_migration = DatetimeMigration()
+
+# --- SLA Engine ---
+# Every open, unbreached ticket carries sla_due_at: the next moment its SLA state can change. The engine
+# only reads tickets whose due time has passed (an index range scan) and either flags a breach or moves
+# sla_due_at to the next deadline. Writes that may change a deadline just set sla_due_at to now. Deadlines
+# are judged on when the ticket was actually claimed or closed, so a late claim that lands while no
+# engine runs still counts, and claim/close check the ticket themselves instead of waiting for the engine.
+SLA_PROJECTION = {"_id": 0, "id": 1, "status": 1, "priority": 1, "subject": 1, "created_at": 1,
+                  "first_response_at": 1, "reopened_at": 1, "closed_at": 1, "sla_breached": 1, "sla_due_at": 1}
+
+def sla_deadlines(ticket: dict, settings: "PanelSettings") -> list:
+    # (kind, deadline, time the deadline was met) for the first response and the resolution SLA
+    def when(field):
+        try:
+            return parse_time(ticket.get(field))
+        except ValueError:
+            return None
+    created, closed = when("created_at"), when("closed_at")
+    first_response = settings.sla_first_response_by_priority.get(ticket.get("priority")) or settings.sla_first_response
+    resolution_start = when("reopened_at") or created
+    return [
+        # Closing an unclaimed ticket is its first response
+        ("first_response", created and created + timedelta(minutes=first_response), when("first_response_at") or closed),
+        ("resolution", resolution_start and resolution_start + timedelta(minutes=settings.sla_resolution), closed),
+    ]
+
+def sla_status(ticket: dict, settings: "PanelSettings", now: datetime):
+    # Returns the missed deadline as (kind, deadline), or None and the next time the state can change
+    if ticket.get("sla_breached"):
+        return None, None
+    next_due = None
+    for kind, deadline, met_at in sla_deadlines(ticket, settings):
+        if deadline is None:
+            continue
+        if met_at is not None:
+            if met_at > deadline:
+                return (kind, deadline), None
+        elif ticket.get("status") == "closed":
+            # Closed without a recorded close time (e.g. through PUT /notes): nothing left to measure
+            continue
+        elif deadline <= now:
+            return (kind, deadline), None
+        else:
+            next_due = deadline if next_due is None else min(next_due, deadline)
+    return None, next_due
+
+async def record_breach(query: dict, ticket: dict, kind: str, deadline: datetime):
+    before = await db.tickets.find_one_and_update(
+        {**query, "sla_breached": {"$ne": True}}, {"$set": {"sla_breached": True, "sla_due_at": None}},
+        projection=TICKET_PROJECTION, return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return
+    await apply_rollups(before, {**before, "sla_breached": True, "sla_due_at": None})
+    await push_event("sla_breach", {"ticket_id": ticket["id"], "subject": ticket.get("subject", ""),
+                                    "priority": ticket.get("priority"), "kind": kind, "due_at": deadline.isoformat()})
+    await audit_log("sla_breach", "system", ticket["id"], f"{kind} due {deadline.isoformat()}")
+
+async def check_sla(ticket: dict, settings: "PanelSettings", now: datetime):
+    missed, next_due = sla_status(ticket, settings, now)
+    # Matching on the sla_due_at we read means a concurrent change always wins over the engine
+    query = {"id": ticket["id"], "sla_due_at": ticket["sla_due_at"]}
+    if missed is None:
+        await db.tickets.update_one(query, {"$set": {"sla_due_at": next_due}})
+        return
+    await record_breach(query, ticket, *missed)
+
+async def check_sla_transition(ticket: dict):
+    # Called with the ticket as a claim or close left it
+    missed, _ = sla_status(ticket, settings_cache.current, datetime.now(timezone.utc))
+    if missed is not None:
+        await record_breach({"id": ticket["id"]}, ticket, *missed)
+
+async def run_sla_checks() -> Optional[datetime]:
+    now = datetime.now(timezone.utc)
+    settings = settings_cache.current
+    due = await db.tickets.find(time_cond("sla_due_at", "$lte", now), SLA_PROJECTION) \
+        .sort("sla_due_at", 1).limit(SLA_ENGINE_BATCH).to_list(SLA_ENGINE_BATCH)
+    for ticket in due:
+        await check_sla(ticket, settings, now)
+    if len(due) == SLA_ENGINE_BATCH:
+        return now
+    upcoming = await db.tickets.find_one(time_cond("sla_due_at", "$gt", now), {"_id": 0, "sla_due_at": 1}, sort=[("sla_due_at", 1)])
+    return parse_time(upcoming["sla_due_at"]) if upcoming else None
+
+async def sla_engine():
+    backfilled = False
+    while True:
+        delay = SLA_ENGINE_INTERVAL
+        try:
+            if await acquire_lease("sla_engine", SLA_LEASE_SECONDS):
+                if not backfilled:
+                    # Tickets created before the engine existed get checked on the first run
+                    result = await db.tickets.update_many(
+                        {"status": {"$ne": "closed"}, "sla_breached": {"$ne": True}, "sla_due_at": {"$exists": False}},
+                        {"$set": {"sla_due_at": datetime.now(timezone.utc)}}
+                    )
+                    if result.modified_count:
+                        logger.info(f"SLA engine scheduled {result.modified_count} existing tickets")
+                    backfilled = True
+                next_due = await run_sla_checks()
+                if next_due:
+                    delay = min(delay, max(0.0, (next_due - datetime.now(timezone.utc)).total_seconds()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"SLA engine run failed: {e}")
+        await asyncio.sleep(delay)
+
+# --- Pagination ---
+# Keyset pagination on (sort field, id): the opaque cursor carries the last row's values, so every page
+# is an index range scan instead of skip() over all earlier rows. Each sort field needs a (field, id) index
+# on the write-heavy tickets collection, so only orders something actually requests are offered; created_at
+# is served by the ticket_summary index.
+TICKET_SORT_FIELDS = {"created_at"}
+
+def encode_cursor(value, doc_id: str) -> str:
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([value, doc_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, doc_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["$date"])
+        if not isinstance(doc_id, str):
+            raise ValueError(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, doc_id
+
+def keyset_filter(field: str, direction: int, value, doc_id: str) -> dict:
+    # Nulls sort first ascending and last descending. Unconverted string timestamps sort between
+    # nulls and dates, so until the datetime migration is done they follow/precede every date.
+    mixed = not datetime_migration.done
+    if direction < 0:
+        if value is None:
+            return {field: None, "id": {"$lt": doc_id}}
+        clauses = [{field: {"$lt": value}}, {field: value, "id": {"$lt": doc_id}}, {field: None}]
+        if mixed and isinstance(value, datetime):
+            clauses.append({field: {"$type": "string"}})
+        return {"$or": clauses}
+    if value is None:
+        return {"$or": [{field: None, "id": {"$gt": doc_id}}, {field: {"$ne": None}}]}
+    clauses = [{field: {"$gt": value}}, {field: value, "id": {"$gt": doc_id}}]
+    if mixed and isinstance(value, str):
+        clauses.append({field: {"$type": "date"}})
+    return {"$or": clauses}
+
+async def count_for(collection, query: dict, total_mode: str) -> Optional[int]:
+    if total_mode == "none":
+        return None
+    if total_mode == "estimated":
+        if not query:
+            return await collection.estimated_document_count()
+        return await collection.count_documents(query, limit=ESTIMATED_COUNT_CAP)
+    return await collection.count_documents(query)
+
+async def paginate(collection, query: dict, sort_field: str, direction: int, limit: int,
+                   page: int = 1, cursor: Optional[str] = None, total_mode: str = "exact",
+                   projection: Optional[dict] = None) -> dict:
+    if total_mode not in ("exact", "estimated", "none"):
+        raise HTTPException(status_code=400, detail="total must be exact, estimated or none")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    find_query = query
+    if cursor:
+        keyset = keyset_filter(sort_field, direction, *decode_cursor(cursor))
+        find_query = {"$and": [query, keyset]} if query else keyset
+    find = collection.find(find_query, projection or {"_id": 0}).sort([(sort_field, direction), ("id", direction)])
+    if not cursor and page > 1:
+        find = find.skip((page - 1) * limit)
+    items = await find.limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].get(sort_field), items[-1]["id"])
+    total = await count_for(collection, query, total_mode)
+    return {"items": items, "total": total, "next_cursor": next_cursor, "limit": limit}
+
+# --- Search Index ---
+# Full words go through the tickets text index (stemmed per ticket language, ranked by score);
+# typeahead prefixes through search_keys, a multikey index of edge n-grams of subject and username.
+SEARCH_LANGUAGES = {"de": "german", "en": "english"}
+SEARCH_PREFIX_MIN = 2
+SEARCH_PREFIX_MAX = 15
+TICKET_PROJECTION = {"_id": 0, "search_keys": 0, "search_language": 0, "idempotency_key": 0}
+ID_PREFIX_RE = re.compile(r"#?([0-9a-f-]{4,36})")
+
+def search_tokens(text: str) -> list:
+    return [t for t in re.findall(r"\w+", (text or "").lower()) if len(t) >= SEARCH_PREFIX_MIN]
+
+def search_fields(ticket: dict) -> dict:
+    keys = set()
+    for token in search_tokens(f"{ticket.get('subject', '')} {ticket.get('username', '')}"):
+        for n in range(SEARCH_PREFIX_MIN, min(len(token), SEARCH_PREFIX_MAX) + 1):
+            keys.add(token[:n])
+    return {"search_keys": sorted(keys), "search_language": SEARCH_LANGUAGES.get(ticket.get("lang"), "none")}
+
+def id_prefix(q: str) -> Optional[str]:
+    # Ticket ids are shown as the first 8 hex chars; anything id-shaped with a digit is an id lookup
+    match = ID_PREFIX_RE.fullmatch(q.strip().lower())
+    if match and any(c.isdigit() for c in match.group(1)):
+        return match.group(1)
+    return None
+
+def text_search(q: str, lang: Optional[str] = None) -> dict:
+    # Quotes and leading dashes are operators for $text; user input is always plain terms
+    terms = " ".join(t.lstrip("-") for t in q.replace('"', " ").split())
+    text = {"$search": terms}
+    if lang in SEARCH_LANGUAGES:
+        text["$language"] = SEARCH_LANGUAGES[lang]
+    return {"$text": text}
+
+def ticket_search_filter(q: str, lang: Optional[str] = None) -> dict:
+    prefix = id_prefix(q)
+    if prefix:
+        return {"id": {"$regex": f"^{re.escape(prefix)}"}}
+    return text_search(q, lang)
+
+async def backfill_search_fields():
+    missing = {"$or": [{"search_keys": {"$exists": False}}, {"description_preview": {"$exists": False}}]}
+    fields = {"_id": 0, "id": 1, "subject": 1, "username": 1, "lang": 1, "description": 1}
+    while True:
+        batch = await db.tickets.find(missing, fields).limit(1000).to_list(1000)
+        if not batch:
+            break
+        await db.tickets.bulk_write([UpdateOne({"id": t["id"]}, {"$set": {**search_fields(t), **summary_fields(t)}}) for t in batch], ordered=False)
+        logger.info(f"Search index backfilled for {len(batch)} tickets")
+
+# --- Ticket Projections ---
+# List and search views get a compact summary by default; fields= picks any other subset. The summary
+# fields are all keys of one index led by (created_at, id), so the default ticket table is answered
+# from the index alone, with status/priority/lang filters applied to the index keys.
+TICKET_PREVIEW_CHARS = 100
+TICKET_SUMMARY_FIELDS = ["created_at", "id", "status", "priority", "lang", "type", "subject", "username",
+                         "claimed_by", "sla_breached", "escalation_flag", "description_preview"]
+TICKET_FIELDS = {
+    "id", "channel_id", "guild_id", "user_id", "username", "subject", "type", "lang", "priority", "status",
+    "description", "description_preview", "notes", "created_at", "claimed_by", "claimed_at", "first_response_at",
+    "closed_at", "closed_by", "reopened_at", "escalation_flag", "sla_breached", "sla_due_at", "version",
+    "transcript_path", "transcript_json_path", "transcript_messages", "transcript_created_at",
+}
+
+def summary_fields(ticket: dict) -> dict:
+    return {"description_preview": (ticket.get("description") or "")[:TICKET_PREVIEW_CHARS]}
+
+def ticket_projection(fields: Optional[str], default: Optional[list] = None, required: tuple = ("id",)) -> dict:
+    if not fields:
+        if default is None:
+            return TICKET_PROJECTION
+        selected = set(default)
+    elif fields.strip() == "*":
+        return TICKET_PROJECTION
+    else:
+        selected = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = selected - TICKET_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return {"_id": 0, **{field: 1 for field in sorted(selected | set(required))}}
+
+# --- Index Catalogue ---
+# Every index the API relies on, per collection, created idempotently at startup. QUERY_SHAPES lists
+# the filter/sort shapes the endpoints issue; the advisor explains each one and flags collection scans.
+INDEX_CATALOGUE = {
+    "tickets": [
+        IndexModel([("id", 1)], unique=True),
+        # The bot refers to tickets by Discord channel id
+        IndexModel([("channel_id", 1)]),
+        IndexModel([("status", 1), ("created_at", -1), ("id", -1)]),
+        IndexModel([("priority", 1), ("created_at", -1), ("id", -1)]),
+        IndexModel([(field, -1 if field in ("created_at", "id") else 1) for field in TICKET_SUMMARY_FIELDS], name="ticket_summary"),
+        IndexModel([("sla_due_at", 1)]),
+        IndexModel([("idempotency_key", 1)], unique=True, sparse=True),
+        IndexModel([("search_keys", 1), ("created_at", -1)]),
+        IndexModel(
+            [("subject", "text"), ("username", "text"), ("description", "text")],
+            name="ticket_text",
+            weights={"subject": 10, "username": 5, "description": 1},
+            default_language="english",
+            language_override="search_language"
+        ),
+    ],
+    "ticket_messages": [
+        IndexModel([("ticket_id", 1), ("timestamp", 1), ("id", 1)]),
+        IndexModel([("id", 1)], unique=True, sparse=True),
+    ],
+    "live_events": [
+        # Also serves newest-first reads: a single-field index is scanned in either direction
+        IndexModel([("timestamp", 1)], name="timestamp_ttl", expireAfterSeconds=int(LIVE_EVENTS_TTL_DAYS * 86400)),
+        IndexModel([("id", 1)]),
+    ],
+    # Also created on every monthly audit_log_YYYY_MM partition
+    "audit_log": [
+        IndexModel([("timestamp", -1), ("id", -1)]),
+        IndexModel([("target_ticket", 1), ("timestamp", -1)]),
+    ],
+    "panel_users": [
+        IndexModel([("username", 1)], unique=True),
+        IndexModel([("id", 1)], unique=True),
+    ],
+    "ticket_rollups": [
+        IndexModel([("kind", 1), ("key", 1)]),
+    ],
+    "settings": [
+        IndexModel([("id", 1)], unique=True),
+    ],
+    "bot_tickets": [
+        IndexModel([("channel_id", 1)], unique=True),
+        # Open first: the state endpoint lists all open tickets as well as one user's
+        IndexModel([("open", 1), ("user_id", 1)]),
+    ],
+    "bot_event_keys": [
+        IndexModel([("created_at", 1)], expireAfterSeconds=int(BOT_EVENT_KEY_TTL_HOURS * 3600)),
+    ],
+    "bot_users": [
+        IndexModel([("user_id", 1)], unique=True),
+    ],
+    "counters": [
+        IndexModel([("name", 1)], unique=True),
+    ],
+    "revoked_users": [
+        IndexModel([("user_id", 1)], unique=True),
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+    ],
+}
+
+QUERY_SHAPES = [
+    ("GET /tickets", "tickets", {}, [("created_at", -1), ("id", -1)]),
+    ("GET /tickets?status", "tickets", {"status": "open"}, [("created_at", -1), ("id", -1)]),
+    ("GET /tickets?priority", "tickets", {"priority": "high"}, [("created_at", -1), ("id", -1)]),
+    ("GET /tickets?search=<id>", "tickets", {"id": {"$regex": "^0a1b"}}, None),
+    ("GET /tickets/{id}", "tickets", {"id": ""}, None),
+    ("GET /tickets/{id} messages", "ticket_messages", {"ticket_id": ""}, [("timestamp", 1), ("id", 1)]),
+    ("SLA engine due", "tickets", {"sla_due_at": {"$lte": EPOCH}}, [("sla_due_at", 1)]),
+    ("bot message ingest", "tickets", {"$or": [{"id": {"$in": [""]}}, {"channel_id": {"$in": [""]}}]}, None),
+    ("bot ticket_close", "tickets", {"$or": [{"id": ""}, {"channel_id": ""}]}, None),
+    ("GET /search prefix", "tickets", {"search_keys": {"$all": ["se"]}}, [("created_at", -1)]),
+    ("GET /recent_events", "live_events", {}, [("timestamp", -1)]),
+    ("GET /events replay", "live_events", {"timestamp": {"$gte": EPOCH}, "id": {"$gt": ""}}, [("id", 1)]),
+    ("GET /audit_log", "audit_log", {}, [("timestamp", -1), ("id", -1)]),
+    ("login", "panel_users", {"username": ""}, None),
+    ("GET /auth/me", "panel_users", {"id": ""}, None),
+    ("analytics rollups", "ticket_rollups", {"kind": "day", "key": {"$gte": ""}}, [("key", 1)]),
+    ("GET /settings", "settings", {"id": "global"}, None),
+    ("bot state hydrate", "bot_tickets", {"channel_id": ""}, None),
+    ("bot state open tickets", "bot_tickets", {"open": True}, None),
+    ("bot state open tickets?user_id", "bot_tickets", {"open": True, "user_id": ""}, None),
+]
+
+async def ensure_indexes():
+    for collection, indexes in INDEX_CATALOGUE.items():
+        if INDEX_RECONCILE:
+            # Before creating, so an old index on the same keys (e.g. timestamp_1) is replaced, not adopted
+            await drop_uncatalogued_indexes(collection, indexes)
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                if "expireAfterSeconds" in index.document and await update_ttl(collection, index):
+                    continue
+                # An index with the same keys but different options exists; leave it for the operator
+                logger.error(f"Index {collection}.{index.document['name']} not created: {e}")
+
+async def drop_uncatalogued_indexes(collection: str, indexes: list):
+    catalogued = {"_id_"} | {index.document["name"] for index in indexes}
+    for name in await db[collection].index_information():
+        if name in catalogued:
+            continue
+        try:
+            await db[collection].drop_index(name)
+        except OperationFailure as e:
+            logger.error(f"Index {collection}.{name} not dropped: {e}")
+            continue
+        logger.info(f"Dropped index {collection}.{name}: not in the index catalogue")
+
+async def update_ttl(collection: str, index: IndexModel) -> bool:
+    # An index on the same key already exists (a changed expiry, or the plain index of older versions):
+    # apply the expiry to that index in place
+    key = dict(index.document["key"])
+    ttl = index.document["expireAfterSeconds"]
+    existing = next((name for name, info in (await db[collection].index_information()).items()
+                     if dict(info["key"]) == key), None)
+    if existing is None:
+        return False
+    try:
+        await db.command({"collMod": collection, "index": {"name": existing, "expireAfterSeconds": ttl}})
+    except OperationFailure:
+        # Servers before 5.1 cannot turn a plain index into a TTL index; rebuild it instead
+        try:
+            await db[collection].drop_index(existing)
+            await db[collection].create_indexes([index])
+        except OperationFailure as e:
+            logger.error(f"TTL for {collection}.{existing} not applied: {e}")
+            return False
+        existing = index.document["name"]
+    logger.info(f"TTL of {collection}.{existing} set to {ttl}s")
+    return True
+
+def plan_stages(plan) -> set:
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= plan_stages(value)
+    return stages
+
+async def explain_query_shapes() -> list:
+    report = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        command = {"find": collection, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explained = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        stages = plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({"endpoint": name, "collection": collection, "stages": sorted(stages), "collscan": "COLLSCAN" in stages})
+    return report
+
+async def index_advisor():
+    try:
+        for entry in await explain_query_shapes():
+            if entry["collscan"]:
+                logger.warning(f"Index advisor: '{entry['endpoint']}' scans the whole {entry['collection']} collection")
+    except Exception as e:
+        logger.error(f"Index advisor failed: {e}")
 
 # --- Auth Routes ---
 @api_router.post("/auth/login")
-async def login(req: LoginRequest):
+async def login(req: LoginRequest, request: Request):
+    retry_after = max(login_ip_limiter.hit(client_ip(request)), login_user_limiter.hit(req.username.lower()))
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many login attempts",
+                            headers={"Retry-After": str(int(retry_after) + 1)})
     user = await db.panel_users.find_one({"username": req.username}, {"_id": 0})
-    if not user or not verify_password(req.password, user["password_hash"]):
+    if not user or not await verify_password(req.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token = create_token(user["id"], user["username"], user["role"])
     await audit_log("login", user["username"])
@@ -159,39 +1517,52 @@ async def login(req: LoginRequest):
 
 @api_router.get("/auth/me")
 async def get_me(user: dict = Depends(get_current_user)):
-    db_user = await db.panel_users.find_one({"id": user["sub"]}, {"_id": 0, "password_hash": 0})
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
+    db_user = profile_cache.get(user["sub"])
+    if db_user is None:
+        db_user = await db.panel_users.find_one({"id": user["sub"]}, {"_id": 0, "password_hash": 0})
+        if not db_user:
+            raise HTTPException(status_code=404, detail="User not found")
+        profile_cache.put(user["sub"], db_user)
     return db_user
 
 # --- KPI Route ---
 @api_router.get("/kpi")
 async def get_kpi(user: dict = Depends(get_current_user)):
-    total = await db.tickets.count_documents({})
-    open_count = await db.tickets.count_documents({"status": {"$in": ["open", "claimed", "escalated"]}})
-    closed_today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0).isoformat()
-    closed_today = await db.tickets.count_documents({"status": "closed", "closed_at": {"$gte": closed_today_start}})
-    escalated = await db.tickets.count_documents({"status": "escalated"})
-    sla_breached = await db.tickets.count_documents({"sla_breached": True, "status": {"$ne": "closed"}})
-
-    pipeline = [
-        {"$match": {"first_response_at": {"$ne": None}, "claimed_at": {"$ne": None}}},
-        {"$project": {"response_minutes": {"$divide": [{"$subtract": [{"$toDate": "$first_response_at"}, {"$toDate": "$claimed_at"}]}, 60000]}}},
-        {"$group": {"_id": None, "avg": {"$avg": "$response_minutes"}}}
-    ]
-    avg_response = await db.tickets.aggregate(pipeline).to_list(1)
-    avg_resp_time = round(avg_response[0]["avg"], 1) if avg_response and avg_response[0].get("avg") else 0
+    return await kpi_cache.get_or_compute("kpi", compute_kpi)
+
+async def compute_kpi() -> dict:
+    # Two rollup documents, whatever the number of tickets: the totals and today's close count
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    docs = {doc["_id"]: doc async for doc in db.ticket_rollups.find({"_id": {"$in": ["total:all", f"closed:{today}"]}})}
+    totals = docs.get("total:all", {})
+    responded = totals.get("responded", 0)
+    avg_resp_time = round(totals.get("response_ms", 0) / responded / 60000, 1) if responded else 0
 
     return {
-        "total_tickets": total,
-        "open_tickets": open_count,
-        "closed_today": closed_today,
-        "escalated": escalated,
-        "sla_breached": sla_breached,
+        "total_tickets": totals.get("tickets", 0),
+        "open_tickets": totals.get("open", 0),
+        "closed_today": docs.get(f"closed:{today}", {}).get("count", 0),
+        "escalated": totals.get("escalated", 0),
+        "sla_breached": totals.get("open_breached", 0),
         "avg_response_time_min": avg_resp_time
     }
 
 # --- Ticket Routes ---
+def ticket_filter(status: Optional[str], priority: Optional[str], lang: Optional[str], search: Optional[str],
+                  sort_by: str) -> dict:
+    if sort_by not in TICKET_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of: {', '.join(sorted(TICKET_SORT_FIELDS))}")
+    query = {}
+    if status:
+        query["status"] = status
+    if priority:
+        query["priority"] = priority
+    if lang:
+        query["lang"] = lang
+    if search:
+        query.update(ticket_search_filter(search, lang))
+    return query
+
 @api_router.get("/tickets")
 async def get_tickets(
     user: dict = Depends(get_current_user),
@@ -202,88 +1573,101 @@ async def get_tickets(
     sort_by: str = "created_at",
     sort_order: str = "desc",
     page: int = 1,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
+    fields: Optional[str] = None
 ):
-    query = {}
-    if status:
-        query["status"] = status
-    if priority:
-        query["priority"] = priority
-    if lang:
-        query["lang"] = lang
-    if search:
-        query["$or"] = [
-            {"subject": {"$regex": search, "$options": "i"}},
-            {"username": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"id": {"$regex": search, "$options": "i"}}
-        ]
-
+    query = ticket_filter(status, priority, lang, search, sort_by)
     sort_dir = -1 if sort_order == "desc" else 1
-    skip = (page - 1) * limit
-    total = await db.tickets.count_documents(query)
-    tickets = await db.tickets.find(query, {"_id": 0}).sort(sort_by, sort_dir).skip(skip).limit(limit).to_list(limit)
-    return {"tickets": tickets, "total": total, "page": page, "pages": (total + limit - 1) // limit if limit else 1}
+    # The sort field is always returned, next_cursor is built from it
+    projection = ticket_projection(fields, TICKET_SUMMARY_FIELDS, required=("id", sort_by))
+    # Counting is opt-in (total=exact|estimated); the ticket table and dashboard never show it
+    result = await paginate(db.tickets, query, sort_by, sort_dir, limit, page=page, cursor=cursor,
+                            total_mode=total or "none", projection=projection)
+    count = result["total"]
+    limit = result["limit"]
+    return {
+        "tickets": result["items"],
+        "total": count,
+        "page": page,
+        "pages": (count + limit - 1) // limit if count is not None else None,
+        "next_cursor": result["next_cursor"]
+    }
 
 @api_router.get("/tickets/{ticket_id}")
-async def get_ticket(ticket_id: str, user: dict = Depends(get_current_user)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
+async def get_ticket(ticket_id: str, fields: Optional[str] = None, user: dict = Depends(get_current_user)):
+    ticket = await db.tickets.find_one({"id": ticket_id}, ticket_projection(fields))
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
-    messages = await db.ticket_messages.find({"ticket_id": ticket_id}, {"_id": 0}).sort("timestamp", 1).to_list(500)
-    return {"ticket": ticket, "messages": messages}
+    return {"ticket": ticket}
+
+@api_router.get("/tickets/{ticket_id}/messages")
+async def get_ticket_messages(ticket_id: str, user: dict = Depends(get_current_user), limit: int = 100,
+                              cursor: Optional[str] = None, since: Optional[datetime] = None):
+    # Oldest first by (timestamp, id). latest_cursor points past the last message returned, so polling
+    # with it (or reacting to ticket_message events) fetches only what arrived since.
+    query = {"ticket_id": ticket_id}
+    if since is not None:
+        query.update(time_cond("timestamp", "$gt", parse_time(since)))
+    result = await paginate(db.ticket_messages, query, "timestamp", 1, limit, cursor=cursor, total_mode="none")
+    messages = result["items"]
+    latest_cursor = encode_cursor(messages[-1]["timestamp"], messages[-1]["id"]) if messages else cursor
+    return {"messages": messages, "next_cursor": result["next_cursor"], "latest_cursor": latest_cursor}
 
 @api_router.put("/tickets/{ticket_id}/claim")
 async def claim_ticket(ticket_id: str, user: dict = Depends(require_support)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-    if ticket.get("claimed_by") and ticket["status"] == "claimed":
-        raise HTTPException(status_code=400, detail="Already claimed")
-    now = datetime.now(timezone.utc).isoformat()
-    await db.tickets.update_one({"id": ticket_id}, {"$set": {
+    now = datetime.now(timezone.utc)
+    # Tickets marked claimed without a supporter (older data) can still be claimed
+    ticket, updated = await transition_ticket(ticket_id, TRANSITIONS["claim"], {
         "claimed_by": user["username"],
         "claimed_at": now,
-        "status": "claimed",
-        "first_response_at": now if not ticket.get("first_response_at") else ticket["first_response_at"]
-    }})
-    await audit_log("ticket_claim", user["username"], ticket_id)
-    await push_event("ticket_claim", {"ticket_id": ticket_id, "claimed_by": user["username"], "subject": ticket.get("subject", "")})
-    return {"status": "claimed", "claimed_by": user["username"]}
+        "status": "claimed"
+    }, set_if_null={"first_response_at": now}, also_from={"status": "claimed", "claimed_by": None},
+        target={"status": "claimed", "claimed_by": user["username"]})
+    if ticket is not None:
+        await check_sla_transition(updated)
+        await audit_log("ticket_claim", user["username"], ticket_id)
+        await push_event("ticket_claim", {"ticket_id": ticket_id, "claimed_by": user["username"], "subject": ticket.get("subject", "")})
+    return {"status": "claimed", "claimed_by": user["username"], "version": updated["version"], "ticket": updated}
 
 @api_router.put("/tickets/{ticket_id}/close")
 async def close_ticket(ticket_id: str, user: dict = Depends(require_support)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-    now = datetime.now(timezone.utc).isoformat()
-    await db.tickets.update_one({"id": ticket_id}, {"$set": {
+    now = datetime.now(timezone.utc)
+    ticket, updated = await transition_ticket(ticket_id, TRANSITIONS["close"], {
         "status": "closed",
         "closed_at": now,
-        "closed_by": user["username"]
-    }})
-    await audit_log("ticket_close", user["username"], ticket_id)
-    await push_event("ticket_close", {"ticket_id": ticket_id, "closed_by": user["username"], "subject": ticket.get("subject", "")})
-    return {"status": "closed"}
+        "closed_by": user["username"],
+        "sla_due_at": None
+    }, target={"status": "closed"})
+    if ticket is not None:
+        await check_sla_transition(updated)
+        await audit_log("ticket_close", user["username"], ticket_id)
+        await push_event("ticket_close", {"ticket_id": ticket_id, "closed_by": user["username"], "subject": ticket.get("subject", "")})
+        spawn(archive_transcript_safely(ticket_id))
+    return {"status": "closed", "version": updated["version"], "ticket": updated}
 
 @api_router.put("/tickets/{ticket_id}/reopen")
 async def reopen_ticket(ticket_id: str, user: dict = Depends(require_support)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-    await db.tickets.update_one({"id": ticket_id}, {"$set": {
+    now = datetime.now(timezone.utc)
+    ticket, updated = await transition_ticket(ticket_id, TRANSITIONS["reopen"], {
         "status": "open",
         "closed_at": None,
-        "closed_by": None
-    }})
-    await audit_log("ticket_reopen", user["username"], ticket_id)
-    return {"status": "reopened"}
+        "closed_by": None,
+        "reopened_at": now,
+        "sla_due_at": now
+    }, target={"status": "open"})
+    if ticket is not None:
+        await audit_log("ticket_reopen", user["username"], ticket_id)
+        await push_event("ticket_reopen", {"ticket_id": ticket_id, "reopened_by": user["username"], "subject": ticket.get("subject", "")})
+    return {"status": "reopened", "version": updated["version"], "ticket": updated}
 
 @api_router.put("/tickets/{ticket_id}/notes")
 async def update_notes(ticket_id: str, update: TicketUpdate, user: dict = Depends(require_support)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
+    if update.status is not None and update.status not in TICKET_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of: {', '.join(sorted(TICKET_STATUSES))}")
+    if update.priority is not None and update.priority not in TICKET_PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(sorted(TICKET_PRIORITIES))}")
     set_fields = {}
     if update.notes is not None:
         set_fields["notes"] = update.notes
@@ -291,64 +1675,229 @@ async def update_notes(ticket_id: str, update: TicketUpdate, user: dict = Depend
         set_fields["priority"] = update.priority
     if update.status is not None:
         set_fields["status"] = update.status
-    if set_fields:
-        await db.tickets.update_one({"id": ticket_id}, {"$set": set_fields})
-        await audit_log("ticket_update", user["username"], ticket_id, json.dumps(set_fields))
-        if update.notes is not None:
-            await push_event("notes_update", {"ticket_id": ticket_id, "user": user["username"]})
-    return {"status": "updated"}
+    if not set_fields:
+        return {"status": "updated"}
+    if update.priority is not None or update.status is not None:
+        set_fields["sla_due_at"] = datetime.now(timezone.utc)
+    ticket, updated = await transition_ticket(ticket_id, None, set_fields, expected_version=update.version)
+    await audit_log("ticket_update", user["username"], ticket_id, json.dumps(set_fields, default=json_default))
+    if update.notes is not None:
+        await push_event("notes_update", {"ticket_id": ticket_id, "user": user["username"]})
+    if update.priority is not None or update.status is not None:
+        await push_event("ticket_update", {"ticket_id": ticket_id, "user": user["username"], "subject": ticket.get("subject", "")})
+    return {"status": "updated", "version": updated["version"]}
 
 @api_router.put("/tickets/{ticket_id}/escalate")
 async def escalate_ticket(ticket_id: str, user: dict = Depends(require_support)):
-    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0})
-    if not ticket:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-    await db.tickets.update_one({"id": ticket_id}, {"$set": {
+    ticket, updated = await transition_ticket(ticket_id, TRANSITIONS["escalate"], {
         "status": "escalated",
         "escalation_flag": True,
-        "priority": "critical"
-    }})
-    await audit_log("ticket_escalate", user["username"], ticket_id)
-    await push_event("escalation", {"ticket_id": ticket_id, "escalated_by": user["username"], "subject": ticket.get("subject", "")})
-    return {"status": "escalated"}
+        "priority": "critical",
+        "sla_due_at": datetime.now(timezone.utc)
+    }, target={"status": "escalated"})
+    if ticket is not None:
+        await audit_log("ticket_escalate", user["username"], ticket_id)
+        await push_event("escalation", {"ticket_id": ticket_id, "escalated_by": user["username"], "subject": ticket.get("subject", "")})
+    return {"status": "escalated", "version": updated["version"], "ticket": updated}
+
+# --- Transcripts ---
+# Messages are paged out of ticket_messages and rendered batch by batch into gzip files named after
+# the sha256 of their content, so a transcript is never held in memory and identical ones are stored
+# once. When purged messages exist, the previous NDJSON transcript is replayed in front of them.
+TRANSCRIPT_FORMATS = {
+    "html": ("transcript_path", "text/html; charset=utf-8", "html"),
+    "json": ("transcript_json_path", "application/x-ndjson", "ndjson"),
+}
+
+class TranscriptWriter:
+    def __init__(self, suffix: str):
+        TRANSCRIPT_DIR.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+        self.tmp_path = TRANSCRIPT_DIR / f".{uuid.uuid4().hex}.{suffix}.gz.tmp"
+        self.raw = open(self.tmp_path, "wb")
+        self.file = gzip.GzipFile(filename="", mode="wb", fileobj=self.raw, mtime=0)
+        self.sha = hashlib.sha256()
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self.sha.update(data)
+        self.file.write(data)
+
+    def finish(self) -> str:
+        self.file.close()
+        self.raw.close()
+        digest = self.sha.hexdigest()
+        relative = f"{digest[:2]}/{digest}.{self.suffix}.gz"
+        (TRANSCRIPT_DIR / digest[:2]).mkdir(exist_ok=True)
+        os.replace(self.tmp_path, TRANSCRIPT_DIR / relative)
+        return relative
+
+    def abort(self):
+        self.file.close()
+        self.raw.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+def transcript_html_header(ticket: dict) -> str:
+    fields = [("Ticket", ticket["id"]), ("User", ticket.get("username", "")), ("Priority", ticket.get("priority", "")),
+              ("Created", as_iso(ticket.get("created_at"))), ("Closed", f"{as_iso(ticket.get('closed_at'))} {ticket.get('closed_by') or ''}")]
+    rows = "".join(f"<tr><th>{name}</th><td>{html.escape(str(value))}</td></tr>" for name, value in fields)
+    return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{html.escape(ticket.get('subject', ''))}</title>"
+            "<style>body{font-family:sans-serif;max-width:900px;margin:auto}.msg{border-bottom:1px solid #ddd;padding:6px 0}"
+            ".author{font-weight:bold}time{color:#888;margin-left:8px;font-size:.85em}p{white-space:pre-wrap;margin:4px 0}</style>"
+            f"</head><body><h1>{html.escape(ticket.get('subject', ''))}</h1><table>{rows}</table>"
+            f"<p>{html.escape(ticket.get('description', ''))}</p><hr>")
+
+def transcript_html_message(message: dict) -> str:
+    attachments = "".join(f"<li><a href=\"{html.escape(url)}\">{html.escape(url)}</a></li>" for url in message.get("attachments") or [])
+    return (f"<div class=\"msg\"><span class=\"author\">{html.escape(message.get('author', ''))}</span>"
+            f"<time>{html.escape(as_iso(message.get('timestamp')))}</time><p>{html.escape(message.get('content', ''))}</p>"
+            + (f"<ul>{attachments}</ul>" if attachments else "") + "</div>")
+
+TRANSCRIPT_HTML_FOOTER = "</body></html>\n"
+
+def read_lines(file, n: int) -> list:
+    return list(islice(file, n))
+
+async def archived_messages(relative: str):
+    file = await asyncio.to_thread(gzip.open, TRANSCRIPT_DIR / relative, "rt", encoding="utf-8")
+    try:
+        while True:
+            lines = await asyncio.to_thread(read_lines, file, TRANSCRIPT_BATCH)
+            if not lines:
+                return
+            yield [json.loads(line) for line in lines]
+    finally:
+        file.close()
+
+async def live_messages(ticket_id: str):
+    query = {"ticket_id": ticket_id}
+    while True:
+        batch = await db.ticket_messages.find(query, {"_id": 0}) \
+            .sort([("timestamp", 1), ("id", 1)]).limit(TRANSCRIPT_BATCH).to_list(TRANSCRIPT_BATCH)
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+        query = {"ticket_id": ticket_id, "$or": [
+            {"timestamp": {"$gt": last["timestamp"]}},
+            {"timestamp": last["timestamp"], "id": {"$gt": last["id"]}},
+        ]}
+
+async def archive_transcript(ticket_id: str) -> Optional[dict]:
+    ticket = await db.tickets.find_one({"id": ticket_id}, TICKET_PROJECTION)
+    if not ticket:
+        return None
+    if not datetime_migration.done:
+        # The keyset walk and purge below compare timestamps, which needs them all of one type
+        await convert_timestamps("ticket_messages", "timestamp", {"ticket_id": ticket_id})
+    html_out, json_out = TranscriptWriter("html"), TranscriptWriter("ndjson")
+    count, last = 0, None
+    try:
+        await asyncio.to_thread(html_out.write, transcript_html_header(ticket))
+        sources = [live_messages(ticket_id)]
+        if ticket.get("transcript_purged_until") and ticket.get("transcript_json_path"):
+            sources.insert(0, archived_messages(ticket["transcript_json_path"]))
+        for source in sources:
+            async for batch in source:
+                await asyncio.to_thread(html_out.write, "".join(transcript_html_message(m) for m in batch))
+                await asyncio.to_thread(json_out.write, "".join(json.dumps(m, default=json_default) + "\n" for m in batch))
+                count += len(batch)
+                if source is sources[-1]:
+                    last = batch[-1]
+        await asyncio.to_thread(html_out.write, TRANSCRIPT_HTML_FOOTER)
+        html_path = await asyncio.to_thread(html_out.finish)
+        json_path = await asyncio.to_thread(json_out.finish)
+    except BaseException:
+        html_out.abort()
+        json_out.abort()
+        raise
+    transcript = {"transcript_path": html_path, "transcript_json_path": json_path, "transcript_messages": count,
+                  "transcript_created_at": datetime.now(timezone.utc)}
+    await db.tickets.update_one({"id": ticket_id}, {"$set": transcript})
+    if TRANSCRIPT_PURGE_MESSAGES and last:
+        # Only while the ticket is still closed; a reopened ticket keeps its messages hot
+        marker = {"timestamp": last["timestamp"], "id": last["id"]}
+        if await db.tickets.find_one_and_update({"id": ticket_id, "status": "closed"}, {"$set": {"transcript_purged_until": marker}}):
+            await db.ticket_messages.delete_many({"ticket_id": ticket_id, "$or": [
+                {"timestamp": {"$lt": marker["timestamp"]}},
+                {"timestamp": marker["timestamp"], "id": {"$lte": marker["id"]}},
+            ]})
+    logger.info(f"Archived transcript of {ticket_id} ({count} messages) to {html_path}")
+    return transcript
+
+async def archive_transcript_safely(ticket_id: str):
+    try:
+        await archive_transcript(ticket_id)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Transcript archival for {ticket_id} failed: {e}")
+
+async def gunzip_chunks(path: Path):
+    file = await asyncio.to_thread(gzip.open, path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(file.read, 64 * 1024):
+            yield chunk
+    finally:
+        file.close()
+
+@api_router.get("/tickets/{ticket_id}/transcript")
+async def download_transcript(ticket_id: str, request: Request, fmt: str = Query("html", alias="format"),
+                              user: dict = Depends(get_current_user)):
+    if fmt not in TRANSCRIPT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(TRANSCRIPT_FORMATS)}")
+    field, media_type, extension = TRANSCRIPT_FORMATS[fmt]
+    ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 0, field: 1})
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    path = TRANSCRIPT_DIR / ticket[field] if ticket.get(field) else None
+    if not path or not path.exists():
+        raise HTTPException(status_code=404, detail="No transcript archived for this ticket")
+    headers = {"Content-Disposition": f"attachment; filename=ticket-{ticket_id[:8]}.{extension}"}
+    # Stored gzip bytes go out as-is to clients that accept them
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return FileResponse(path, media_type=media_type, headers={**headers, "Content-Encoding": "gzip"})
+    return StreamingResponse(gunzip_chunks(path), media_type=media_type, headers=headers)
 
 # --- Search Route ---
 @api_router.get("/search")
-async def search_tickets(q: str = Query(""), user: dict = Depends(get_current_user)):
-    if not q:
+async def search_tickets(q: str = Query(""), lang: Optional[str] = None, fields: Optional[str] = None,
+                         user: dict = Depends(get_current_user)):
+    projection = ticket_projection(fields, TICKET_SUMMARY_FIELDS)
+    if not q.strip():
         return {"results": []}
-    query = {"$or": [
-        {"subject": {"$regex": q, "$options": "i"}},
-        {"username": {"$regex": q, "$options": "i"}},
-        {"description": {"$regex": q, "$options": "i"}},
-        {"id": {"$regex": q, "$options": "i"}}
-    ]}
-    results = await db.tickets.find(query, {"_id": 0}).limit(20).to_list(20)
+    if id_prefix(q):
+        results = await db.tickets.find(ticket_search_filter(q), projection).limit(20).to_list(20)
+        return {"results": results}
+    results = []
+    if any(len(t) > 1 for t in q.split()):
+        results = await db.tickets.find(text_search(q, lang), {**projection, "score": {"$meta": "textScore"}}).sort([("score", {"$meta": "textScore"})]).limit(20).to_list(20)
+    # Fill up with prefix matches so half-typed words still find tickets
+    tokens = [t[:SEARCH_PREFIX_MAX] for t in search_tokens(q)]
+    if len(results) < 20 and tokens:
+        seen = [r["id"] for r in results]
+        prefix_query = {"search_keys": {"$all": tokens}, "id": {"$nin": seen}}
+        more = await db.tickets.find(prefix_query, projection).sort("created_at", -1).limit(20 - len(results)).to_list(20)
+        results.extend(more)
     return {"results": results}
 
 # --- Support Stats ---
 @api_router.get("/support_stats")
 async def get_support_stats(user: dict = Depends(get_current_user)):
-    pipeline = [
-        {"$match": {"claimed_by": {"$ne": None}}},
-        {"$group": {
-            "_id": "$claimed_by",
-            "total_tickets": {"$sum": 1},
-            "closed_tickets": {"$sum": {"$cond": [{"$eq": ["$status", "closed"]}, 1, 0]}},
-            "escalations": {"$sum": {"$cond": [{"$eq": ["$escalation_flag", True]}, 1, 0]}},
-            "sla_breaches": {"$sum": {"$cond": [{"$eq": ["$sla_breached", True]}, 1, 0]}},
-        }}
-    ]
-    stats = await db.tickets.aggregate(pipeline).to_list(100)
+    stats = await get_rollups("supporter")
     result = []
     for s in stats:
-        score = max(0, 100 - (s["escalations"] * 10) - (s["sla_breaches"] * 15))
+        if not s.get("total"):
+            continue
+        escalations = s.get("escalations", 0)
+        sla_breaches = s.get("sla_breaches", 0)
+        score = max(0, 100 - (escalations * 10) - (sla_breaches * 15))
         result.append({
-            "supporter": s["_id"],
-            "total_tickets": s["total_tickets"],
-            "closed_tickets": s["closed_tickets"],
-            "escalations": s["escalations"],
-            "sla_breaches": s["sla_breaches"],
+            "supporter": s["key"],
+            "total_tickets": s["total"],
+            "closed_tickets": s.get("closed", 0),
+            "escalations": escalations,
+            "sla_breaches": sla_breaches,
             "score": score
         })
     result.sort(key=lambda x: x["score"], reverse=True)
@@ -357,54 +1906,73 @@ async def get_support_stats(user: dict = Depends(get_current_user)):
 # --- SLA Route ---
 @api_router.get("/sla")
 async def get_sla(user: dict = Depends(get_current_user)):
-    total = await db.tickets.count_documents({})
-    breached = await db.tickets.count_documents({"sla_breached": True})
+    totals = await db.ticket_rollups.find_one({"_id": "total:all"}) or {}
+    total = totals.get("tickets", 0)
+    breached = totals.get("breached", 0)
     compliance = round(((total - breached) / total * 100), 1) if total > 0 else 100
-    pipeline_by_priority = [
-        {"$group": {
-            "_id": "$priority",
-            "total": {"$sum": 1},
-            "breached": {"$sum": {"$cond": [{"$eq": ["$sla_breached", True]}, 1, 0]}}
-        }}
-    ]
-    by_priority = await db.tickets.aggregate(pipeline_by_priority).to_list(10)
     priority_data = {}
-    for p in by_priority:
-        t = p["total"]
-        b = p["breached"]
-        priority_data[p["_id"]] = {"total": t, "breached": b, "compliance": round(((t - b) / t * 100), 1) if t > 0 else 100}
-    pipeline_by_day = [
-        {"$group": {
-            "_id": {"$substr": ["$created_at", 0, 10]},
-            "total": {"$sum": 1},
-            "breached": {"$sum": {"$cond": [{"$eq": ["$sla_breached", True]}, 1, 0]}}
-        }},
-        {"$sort": {"_id": 1}},
-        {"$limit": 30}
-    ]
-    by_day = await db.tickets.aggregate(pipeline_by_day).to_list(30)
-    daily = [{"date": d["_id"], "total": d["total"], "breached": d["breached"]} for d in by_day]
+    for p in await get_rollups("priority"):
+        t = p.get("total", 0)
+        b = p.get("breached", 0)
+        if t:
+            priority_data[p["key"]] = {"total": t, "breached": b, "compliance": round(((t - b) / t * 100), 1)}
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=29)).strftime("%Y-%m-%d")
+    by_day = await get_rollups("day", since=cutoff)
+    daily = [{"date": d["key"], "total": d.get("opened", 0), "breached": d.get("breached", 0)} for d in by_day if d.get("opened")]
     return {"compliance": compliance, "total": total, "breached": breached, "by_priority": priority_data, "daily": daily}
 
 # --- SSE Events ---
+async def events_since(last_event_id: str) -> list:
+    if recent_events and recent_events[0]["id"] <= last_event_id:
+        return sorted((e for e in recent_events if e["id"] > last_event_id), key=lambda e: e["id"])[:SSE_REPLAY_LIMIT]
+    since = event_id_time(last_event_id)
+    if since is None:
+        return []
+    # Legacy uuid ids would compare as newer; the timestamp bound keeps them out and uses the index
+    query = {**time_cond("timestamp", "$gte", since), "id": {"$gt": last_event_id}}
+    return await db.live_events.find(query, {"_id": 0}).sort("id", 1).limit(SSE_REPLAY_LIMIT).to_list(SSE_REPLAY_LIMIT)
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\ndata: {json.dumps(event, default=json_default)}\n\n"
+
+async def stream_user(request: Request, token: Optional[str] = None) -> dict:
+    # EventSource can't set headers, so the dashboard passes its JWT as ?token=; the bot sends its own token
+    if DISCORD_BOT_TOKEN and request.headers.get("X-Bot-Token", "") == DISCORD_BOT_TOKEN:
+        return {"sub": None, "username": "bot", "role": "bot"}
+    if token:
+        return decode_token(token)
+    return await get_current_user(request)
+
 @api_router.get("/events")
-async def sse_stream(request: Request):
-    queue = asyncio.Queue()
-    sse_clients.append(queue)
+async def sse_stream(request: Request, last_event_id: Optional[str] = None, ticket_id: Optional[str] = None,
+                     user: dict = Depends(stream_user)):
+    # Register before reading the backlog so nothing published meanwhile is lost
+    sse_client = SSEClient(ticket_id=ticket_id, user_id=user.get("sub"))
+    sse_clients.append(sse_client)
+    last_event_id = request.headers.get("Last-Event-ID") or last_event_id
 
     async def event_generator():
+        replayed_until = last_event_id or ""
         try:
-            while True:
+            if last_event_id:
+                for event in await events_since(last_event_id):
+                    replayed_until = event["id"]
+                    if sse_client.wants(event):
+                        yield format_sse(event)
+            while not sse_client.closed:
                 if await request.is_disconnected():
                     break
-                try:
-                    event = await asyncio.wait_for(queue.get(), timeout=30.0)
-                    yield f"data: {json.dumps(event)}\n\n"
-                except asyncio.TimeoutError:
+                event = await sse_client.get(timeout=30.0)
+                if event is not None:
+                    if event["id"] <= replayed_until:
+                        continue
+                    yield format_sse(event)
+                elif not sse_client.closed:
                     yield f"data: {json.dumps({'event_type': 'heartbeat', 'timestamp': datetime.now(timezone.utc).isoformat()})}\n\n"
         finally:
-            if queue in sse_clients:
-                sse_clients.remove(queue)
+            sse_client.close()
+            if sse_client in sse_clients:
+                sse_clients.remove(sse_client)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream", headers={
         "Cache-Control": "no-cache",
@@ -412,19 +1980,64 @@ async def sse_stream(request: Request):
         "X-Accel-Buffering": "no"
     })
 
+@api_router.get("/events/metrics")
+async def sse_metrics(user: dict = Depends(require_admin)):
+    clients = [c.metrics() for c in sse_clients]
+    return {
+        "worker_pid": os.getpid(),
+        "connected": len(clients),
+        "queued": sum(c["queued"] for c in clients),
+        "max_lag_seconds": max((c["lag_seconds"] for c in clients), default=0),
+        "write_behind": {
+            "audit_pending": len(audit_buffer.pending),
+            "events_pending": len(event_buffer.pending),
+            "written": audit_buffer.written + event_buffer.written
+        },
+        "clients": clients
+    }
+
 # --- Recent Events (for initial load) ---
 @api_router.get("/recent_events")
 async def get_recent_events(user: dict = Depends(get_current_user)):
-    events = await db.live_events.find({}, {"_id": 0}).sort("timestamp", -1).limit(50).to_list(50)
+    query = {"event_type": {"$nin": list(SSE_TICKET_ONLY_EVENTS)}}
+    events = await db.live_events.find(query, {"_id": 0}).sort("timestamp", -1).limit(50).to_list(50)
     return {"events": events}
 
 # --- Bot Webhook Routes ---
-@api_router.post("/bot/ticket")
-async def bot_create_ticket(ticket: BotTicketCreate, request: Request):
-    bot_token = request.headers.get("X-Bot-Token", "")
-    if bot_token != DISCORD_BOT_TOKEN:
+async def verify_bot(request: Request):
+    if request.headers.get("X-Bot-Token", "") != DISCORD_BOT_TOKEN:
         raise HTTPException(status_code=403, detail="Invalid bot token")
-    now = datetime.now(timezone.utc).isoformat()
+
+# Idempotency keys of accepted bot events are stored as _ids in bot_event_keys, so an outbox replay is
+# dropped whichever worker it reaches. A key is forgotten again if handling its event fails.
+async def first_deliveries(keys: list) -> list:
+    # One flag per key: False when the key was delivered before (or earlier in the same list)
+    now = datetime.now(timezone.utc)
+    docs = [{"_id": key, "created_at": now} for key in dict.fromkeys(key for key in keys if key)]
+    delivered = set()
+    if docs:
+        try:
+            await db.bot_event_keys.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            delivered = {docs[err["index"]]["_id"] for err in errors}
+    flags = []
+    for key in keys:
+        flags.append(not key or key not in delivered)
+        if key:
+            delivered.add(key)
+    return flags
+
+async def forget_deliveries(keys: list):
+    keys = [key for key in keys if key]
+    if keys:
+        await db.bot_event_keys.delete_many({"_id": {"$in": keys}})
+
+@api_router.post("/bot/ticket", dependencies=[Depends(verify_bot)])
+async def bot_create_ticket(ticket: BotTicketCreate, idempotency_key: Optional[str] = Header(None)):
+    now = datetime.now(timezone.utc)
     doc = {
         "id": str(uuid.uuid4()),
         "channel_id": ticket.channel_id,
@@ -446,29 +2059,450 @@ async def bot_create_ticket(ticket: BotTicketCreate, request: Request):
         "notes": "",
         "escalation_flag": False,
         "sla_breached": False,
-        "transcript_path": None
+        "transcript_path": None,
+        "version": 0
     }
-    await db.tickets.insert_one(doc)
+    doc["sla_due_at"] = sla_status(doc, settings_cache.current, now)[1]
+    doc.update(search_fields(doc))
+    doc.update(summary_fields(doc))
+    if idempotency_key:
+        doc["idempotency_key"] = idempotency_key
+    try:
+        await db.tickets.insert_one(doc)
+    except DuplicateKeyError:
+        # The bot's outbox replayed a ticket that was already created
+        existing = await db.tickets.find_one({"idempotency_key": idempotency_key}, {"_id": 0, "id": 1})
+        if not idempotency_key or not existing:
+            raise
+        return {"ticket_id": existing["id"], "status": "exists"}
     del doc["_id"]
+    await apply_rollups(None, doc)
     await push_event("ticket_open", {"ticket_id": doc["id"], "username": ticket.username, "subject": ticket.subject, "priority": ticket.priority})
     await audit_log("ticket_create", f"bot:{ticket.username}", doc["id"], f"Subject: {ticket.subject}")
     return {"ticket_id": doc["id"], "status": "created"}
 
-@api_router.post("/bot/event")
-async def bot_push_event(event: BotEventCreate, request: Request):
-    bot_token = request.headers.get("X-Bot-Token", "")
-    if bot_token != DISCORD_BOT_TOKEN:
-        raise HTTPException(status_code=403, detail="Invalid bot token")
-    await push_event(event.event_type, event.data)
+async def bot_ticket_closed(data: dict):
+    # Closed in Discord: close the panel ticket too (it may already be) and archive its transcript
+    ref = str(data.get("ticket_id", ""))
+    ticket = await db.tickets.find_one({"$or": [{"id": ref}, {"channel_id": ref}]}, {"_id": 0, "id": 1})
+    if not ticket:
+        return
+    closed_by = data.get("closed_by") or "bot"
+    try:
+        before, updated = await transition_ticket(ticket["id"], TRANSITIONS["close"], {
+            "status": "closed",
+            "closed_at": datetime.now(timezone.utc),
+            "closed_by": closed_by,
+            "sla_due_at": None
+        }, target={"status": "closed"})
+    except HTTPException:
+        return
+    if before is not None:
+        await check_sla_transition(updated)
+        await audit_log("ticket_close", f"bot:{closed_by}", ticket["id"])
+    spawn(archive_transcript_safely(ticket["id"]))
+
+@api_router.post("/bot/event", dependencies=[Depends(verify_bot)])
+async def bot_push_event(event: BotEventCreate, idempotency_key: Optional[str] = Header(None)):
+    key = event.id or idempotency_key
+    if (await first_deliveries([key]))[0]:
+        try:
+            await push_event(event.event_type, event.data)
+            if event.event_type == "ticket_close":
+                await bot_ticket_closed(event.data)
+        except Exception:
+            await forget_deliveries([key])
+            raise
     return {"status": "ok"}
 
+@api_router.post("/bot/events:batch", dependencies=[Depends(verify_bot)])
+async def bot_push_events(batch: BotEventBatch):
+    flags = await first_deliveries([event.id for event in batch.items])
+    events = [event for event, first in zip(batch.items, flags) if first]
+    try:
+        await push_events([(event.event_type, event.data) for event in events])
+        for event in events:
+            if event.event_type == "ticket_close":
+                await bot_ticket_closed(event.data)
+    except Exception:
+        await forget_deliveries([event.id for event in events])
+        raise
+    return {"status": "ok", "accepted": len(batch.items)}
+
+async def ingest_messages(items: List[BotMessageCreate]) -> int:
+    # The bot knows tickets by Discord channel id; messages are stored under the panel ticket id
+    refs = list({item.ticket_id for item in items})
+    tickets = await db.tickets.find({"$or": [{"id": {"$in": refs}}, {"channel_id": {"$in": refs}}]}, {"_id": 0, "id": 1, "channel_id": 1}).to_list(None)
+    ticket_ids = {t["channel_id"]: t["id"] for t in tickets}
+    ticket_ids.update({t["id"]: t["id"] for t in tickets})
+    now = datetime.now(timezone.utc)
+    docs = [{
+        "id": item.id or str(uuid.uuid4()),
+        "ticket_id": ticket_ids.get(item.ticket_id, item.ticket_id),
+        "author": item.author,
+        "author_id": item.author_id,
+        "content": item.content,
+        "timestamp": parse_time(item.timestamp) or now,
+        "attachments": item.attachments
+    } for item in items]
+    inserted = len(docs)
+    try:
+        await db.ticket_messages.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Redelivered messages hit the unique id index and are skipped
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        inserted = e.details.get("nInserted", 0)
+    if inserted:
+        counts = {}
+        for doc in docs:
+            counts[doc["ticket_id"]] = counts.get(doc["ticket_id"], 0) + 1
+        # One ticket_message per ticket lets an open ticket view fetch just the new messages
+        await push_events([("message_batch", {"count": inserted, "tickets": counts})] +
+                          [("ticket_message", {"ticket_id": ticket_id, "count": n}) for ticket_id, n in counts.items()])
+    return inserted
+
+@api_router.post("/bot/message", dependencies=[Depends(verify_bot)])
+async def bot_push_message(message: BotMessageCreate):
+    inserted = await ingest_messages([message])
+    return {"status": "ok", "inserted": inserted}
+
+@api_router.post("/bot/messages:batch", dependencies=[Depends(verify_bot)])
+async def bot_push_messages(batch: BotMessageBatch):
+    inserted = await ingest_messages(batch.items) if batch.items else 0
+    return {"status": "ok", "accepted": len(batch.items), "inserted": inserted}
+
+# --- Bot State ---
+# Backing store for bots running with BOT_STATE_BACKEND=api, so shards and restarted processes share state
+@api_router.get("/bot/state/tickets", dependencies=[Depends(verify_bot)])
+async def bot_state_open_tickets(user_id: Optional[str] = None):
+    query = {"open": True}
+    if user_id:
+        query["user_id"] = user_id
+    tickets = await db.bot_tickets.find(query, {"_id": 0}).to_list(10000)
+    return {"tickets": tickets}
+
+@api_router.get("/bot/state/tickets/{channel_id}", dependencies=[Depends(verify_bot)])
+async def bot_state_get_ticket(channel_id: str):
+    ticket = await db.bot_tickets.find_one({"channel_id": channel_id}, {"_id": 0})
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket state not found")
+    return ticket
+
+@api_router.post("/bot/state/tickets/{channel_id}", dependencies=[Depends(verify_bot)])
+async def bot_state_put_ticket(channel_id: str, state: BotStateTicket):
+    await db.bot_tickets.update_one(
+        {"channel_id": channel_id},
+        {"$set": {"user_id": state.user_id, "open": state.open, "data": state.data, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    return {"status": "ok"}
+
+@api_router.get("/bot/state/users/{user_id}", dependencies=[Depends(verify_bot)])
+async def bot_state_get_user(user_id: str):
+    user = await db.bot_users.find_one({"user_id": user_id}, {"_id": 0})
+    return user or {"user_id": user_id, "last_ticket_at": None}
+
+@api_router.post("/bot/state/users/{user_id}", dependencies=[Depends(verify_bot)])
+async def bot_state_put_user(user_id: str, state: BotStateUser):
+    await db.bot_users.update_one({"user_id": user_id}, {"$set": {"last_ticket_at": state.last_ticket_at}}, upsert=True)
+    return {"status": "ok"}
+
+@api_router.post("/bot/state/counters/{name}", dependencies=[Depends(verify_bot)])
+async def bot_state_counter(name: str, change: BotStateCounter):
+    # seed only ever raises the counter, so every shard can safely seed from what it sees on startup
+    if change.seed:
+        await db.counters.update_one({"name": name}, {"$max": {"value": change.seed}}, upsert=True)
+    if not change.request_id or not change.increment:
+        counter = await db.counters.find_one_and_update(
+            {"name": name}, {"$inc": {"value": change.increment}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return {"name": name, "value": counter["value"]}
+    # The counter keeps the values it handed out to its last requests; a repeated request_id gets its
+    # earlier value back instead of a second increment
+    value = {"$add": [{"$ifNull": ["$value", 0]}, change.increment]}
+    recorded = {"$concatArrays": [{"$ifNull": ["$requests", []]}, [{"id": {"$literal": change.request_id}, "value": "$value"}]]}
+    for _ in range(3):
+        try:
+            counter = await db.counters.find_one_and_update(
+                {"name": name, "requests.id": {"$ne": change.request_id}},
+                [{"$set": {"value": value}}, {"$set": {"requests": {"$slice": [recorded, -COUNTER_REQUEST_HISTORY]}}}],
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            return {"name": name, "value": counter["value"]}
+        except DuplicateKeyError:
+            # Either the request was applied already, or another request created the counter first
+            counter = await db.counters.find_one({"name": name, "requests.id": change.request_id}, {"_id": 0, "requests.$": 1})
+            if counter:
+                return {"name": name, "value": counter["requests"][0]["value"]}
+    raise HTTPException(status_code=409, detail=f"Counter {name} is contended, retry")
+
+# --- Retention ---
+# Audit entries are written to one collection per month. Reads go newest partition first, ending with
+# the pre-partition audit_log collection, whose entries the retention job moves into their partitions.
+# Partitions older than AUDIT_RETENTION_MONTHS are streamed to gzip NDJSON and dropped.
+AUDIT_PARTITION_PREFIX = "audit_log_"
+AUDIT_PARTITION_RE = re.compile(r"^audit_log_\d{4}_\d{2}$")
+audit_partitions_ready: set = set()
+
+def audit_partition(timestamp) -> str:
+    if not isinstance(timestamp, datetime):
+        return "audit_log"
+    return f"{AUDIT_PARTITION_PREFIX}{timestamp.year:04d}_{timestamp.month:02d}"
+
+def months_before(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 - months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+async def ensure_audit_partitions():
+    # This month's and next month's partitions get their indexes before the first entry lands there
+    now = datetime.now(timezone.utc)
+    for name in (audit_partition(now), audit_partition(months_before(now, -1))):
+        if name not in audit_partitions_ready:
+            await db[name].create_indexes(INDEX_CATALOGUE["audit_log"])
+            audit_partitions_ready.add(name)
+
+async def list_audit_partitions() -> list:
+    names = [name for name in await db.list_collection_names() if AUDIT_PARTITION_RE.match(name)]
+    return sorted(names, reverse=True) + ["audit_log"]
+
+async def move_legacy_audit_entries() -> int:
+    moved = 0
+    while True:
+        docs = await db.audit_log.find({"timestamp": {"$type": "date"}}).limit(RETENTION_BATCH).to_list(RETENTION_BATCH)
+        if not docs:
+            return moved
+        by_partition = {}
+        for doc in docs:
+            by_partition.setdefault(audit_partition(doc["timestamp"]), []).append(doc)
+        for name, batch in by_partition.items():
+            try:
+                await db[name].insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Already copied by an earlier run that stopped before deleting
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+        await db.audit_log.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved += len(docs)
+        await asyncio.sleep(DATETIME_MIGRATION_PAUSE)
+
+def archive_path(name: str) -> Path:
+    # A partition refilled after it was archived gets a numbered second file instead of overwriting
+    path, n = AUDIT_ARCHIVE_DIR / f"{name}.ndjson.gz", 0
+    while path.exists():
+        n += 1
+        path = AUDIT_ARCHIVE_DIR / f"{name}.{n}.ndjson.gz"
+    return path
+
+async def archive_audit_partition(name: str) -> int:
+    await asyncio.to_thread(AUDIT_ARCHIVE_DIR.mkdir, parents=True, exist_ok=True)
+    path = archive_path(name)
+    tmp_path = path.with_name(path.name + ".tmp")
+    file = await asyncio.to_thread(gzip.open, tmp_path, "wt", encoding="utf-8")
+    count = 0
+    try:
+        lines = []
+        async for doc in db[name].find({}, {"_id": 0}).sort([("timestamp", 1), ("id", 1)]).batch_size(RETENTION_BATCH):
+            lines.append(json.dumps(doc, default=json_default) + "\n")
+            if len(lines) >= RETENTION_BATCH:
+                await asyncio.to_thread(file.writelines, lines)
+                count += len(lines)
+                lines = []
+        await asyncio.to_thread(file.writelines, lines)
+        count += len(lines)
+        await asyncio.to_thread(file.close)
+    except BaseException:
+        file.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    if count != await db[name].count_documents({}):
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError(f"{name} changed while it was being archived")
+    os.replace(tmp_path, path)
+    await db.audit_archives.insert_one({"partition": name, "path": str(path.relative_to(AUDIT_ARCHIVE_DIR)),
+                                        "entries": count, "archived_at": datetime.now(timezone.utc)})
+    await db[name].drop()
+    audit_partitions_ready.discard(name)
+    return count
+
+async def run_retention():
+    moved = await move_legacy_audit_entries()
+    if moved:
+        logger.info(f"Moved {moved} audit_log entries into monthly partitions")
+    if AUDIT_RETENTION_MONTHS <= 0:
+        return
+    oldest_kept = audit_partition(months_before(datetime.now(timezone.utc), AUDIT_RETENTION_MONTHS))
+    for name in await list_audit_partitions():
+        if name != "audit_log" and name < oldest_kept:
+            await acquire_lease("retention", SLA_LEASE_SECONDS)
+            count = await archive_audit_partition(name)
+            logger.info(f"Archived {count} audit entries of {name} to {AUDIT_ARCHIVE_DIR}")
+
+async def retention_job():
+    while True:
+        try:
+            await ensure_audit_partitions()
+            if datetime_migration.done and await acquire_lease("retention", SLA_LEASE_SECONDS):
+                await run_retention()
+                await release_lease("retention")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Retention run failed: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL)
+
 # --- Audit Log ---
+async def paginate_partitions(collections: list, sort_field: str, direction: int, limit: int,
+                              page: int = 1, cursor: Optional[str] = None, total_mode: str = "exact") -> dict:
+    # paginate() across collections that each hold a contiguous, ordered slice of the data
+    if total_mode not in ("exact", "estimated", "none"):
+        raise HTTPException(status_code=400, detail="total must be exact, estimated or none")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = keyset_filter(sort_field, direction, *decode_cursor(cursor)) if cursor else {}
+    skip = (page - 1) * limit if not cursor and page > 1 else 0
+    items = []
+    for collection in collections:
+        if skip:
+            size = await collection.count_documents({})
+            if skip >= size:
+                skip -= size
+                continue
+        find = collection.find(query, {"_id": 0}).sort([(sort_field, direction), ("id", direction)])
+        items += await find.skip(skip).limit(limit + 1 - len(items)).to_list(None)
+        skip = 0
+        if len(items) > limit:
+            break
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].get(sort_field), items[-1]["id"])
+    total = None
+    if total_mode != "none":
+        total = sum([await count_for(collection, {}, total_mode) for collection in collections])
+    return {"items": items, "total": total, "next_cursor": next_cursor, "limit": limit}
+
 @api_router.get("/audit_log")
-async def get_audit_log(user: dict = Depends(get_current_user), page: int = 1, limit: int = 100):
-    skip = (page - 1) * limit
-    total = await db.audit_log.count_documents({})
-    logs = await db.audit_log.find({}, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
-    return {"logs": logs, "total": total}
+async def get_audit_log(user: dict = Depends(get_current_user), page: int = 1, limit: int = 100,
+                        cursor: Optional[str] = None, total: Optional[str] = None):
+    partitions = [db[name] for name in await list_audit_partitions()]
+    result = await paginate_partitions(partitions, "timestamp", -1, limit, page=page, cursor=cursor,
+                                       total_mode=total or "none")
+    return {"logs": result["items"], "total": result["total"], "next_cursor": result["next_cursor"]}
+
+# --- Exports ---
+# Exports stream a cursor batch by batch into the response, so memory stays flat however many rows
+# match. Encoding and gzip run in a worker thread; CSV columns are fixed per export.
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+EXPORT_COLUMNS = {
+    "tickets": ["id", "channel_id", "user_id", "username", "subject", "type", "lang", "priority", "status",
+                "created_at", "claimed_by", "claimed_at", "first_response_at", "closed_at", "closed_by",
+                "escalation_flag", "sla_breached", "notes"],
+    "messages": ["id", "ticket_id", "author", "author_id", "timestamp", "content", "attachments"],
+    "audit_log": ["id", "timestamp", "action", "user", "target_ticket", "details"],
+}
+
+def csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return "" if value is None else value
+
+class ExportEncoder:
+    def __init__(self, fmt: str, columns: list, compress: bool):
+        self.fmt = fmt
+        self.columns = columns
+        # wbits=31 writes a gzip container
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def text(self, docs: list) -> str:
+        if self.fmt == "ndjson":
+            return "".join(json.dumps(doc, default=json_default) + "\n" for doc in docs)
+        out = io.StringIO()
+        csv.writer(out).writerows([[csv_value(doc.get(column)) for column in self.columns] for doc in docs])
+        return out.getvalue()
+
+    def header(self) -> bytes:
+        if self.fmt != "csv":
+            return self.pack("")
+        out = io.StringIO()
+        csv.writer(out).writerow(self.columns)
+        return self.pack(out.getvalue())
+
+    def encode(self, docs: list) -> bytes:
+        return self.pack(self.text(docs))
+
+    def pack(self, text: str) -> bytes:
+        data = text.encode()
+        return self.compressor.compress(data) if self.compressor else data
+
+    def finish(self) -> bytes:
+        return self.compressor.flush() if self.compressor else b""
+
+async def export_chunks(cursors: list, encoder: ExportEncoder):
+    try:
+        yield encoder.header()
+        for cursor in cursors:
+            batch = []
+            async for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= EXPORT_BATCH:
+                    yield await asyncio.to_thread(encoder.encode, batch)
+                    batch = []
+            if batch:
+                yield await asyncio.to_thread(encoder.encode, batch)
+        yield encoder.finish()
+    finally:
+        for cursor in cursors:
+            await cursor.close()
+
+def export_response(name: str, cursors: list, fmt: str, compress: bool) -> StreamingResponse:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    media_type = EXPORT_FORMATS[fmt]
+    if compress:
+        filename, media_type = filename + ".gz", "application/gzip"
+    encoder = ExportEncoder(fmt, EXPORT_COLUMNS[name], compress)
+    return StreamingResponse(export_chunks(cursors, encoder), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@api_router.get("/export/tickets")
+async def export_tickets(
+    user: dict = Depends(get_current_user),
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    lang: Optional[str] = None,
+    search: Optional[str] = None,
+    sort_by: str = "created_at",
+    sort_order: str = "desc",
+    fmt: str = Query("ndjson", alias="format"),
+    compress: bool = Query(False, alias="gzip")
+):
+    query = ticket_filter(status, priority, lang, search, sort_by)
+    sort_dir = -1 if sort_order == "desc" else 1
+    cursor = db.tickets.find(query, TICKET_PROJECTION, allow_disk_use=True) \
+        .sort([(sort_by, sort_dir), ("id", sort_dir)]).batch_size(EXPORT_BATCH)
+    return export_response("tickets", [cursor], fmt, compress)
+
+@api_router.get("/export/messages")
+async def export_messages(user: dict = Depends(get_current_user), ticket_id: Optional[str] = None,
+                          fmt: str = Query("ndjson", alias="format"), compress: bool = Query(False, alias="gzip")):
+    # Messages of purged tickets are only in their archived transcripts
+    if ticket_id:
+        cursor = db.ticket_messages.find({"ticket_id": ticket_id}, {"_id": 0}).sort([("timestamp", 1), ("id", 1)])
+    else:
+        # Insertion order via _id; a full sort on timestamp would have to buffer the whole collection
+        cursor = db.ticket_messages.find({}, {"_id": 0}).sort("_id", 1)
+    return export_response("messages", [cursor.batch_size(EXPORT_BATCH)], fmt, compress)
+
+@api_router.get("/export/audit_log")
+async def export_audit_log(user: dict = Depends(get_current_user), fmt: str = Query("ndjson", alias="format"),
+                           compress: bool = Query(False, alias="gzip")):
+    # Oldest first: the pre-partition collection, then the monthly partitions in order
+    cursors = [db[name].find({}, {"_id": 0}).sort([("timestamp", 1), ("id", 1)]).batch_size(EXPORT_BATCH)
+               for name in reversed(await list_audit_partitions())]
+    return export_response("audit_log", cursors, fmt, compress)
 
 # --- Admin Routes ---
 @api_router.get("/admin/users")
@@ -484,9 +2518,9 @@ async def create_user(req: CreateUserRequest, user: dict = Depends(require_admin
     doc = {
         "id": str(uuid.uuid4()),
         "username": req.username,
-        "password_hash": hash_password(req.password),
+        "password_hash": await hash_password(req.password),
         "role": req.role,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
     await db.panel_users.insert_one(doc)
     await audit_log("user_create", user["username"], details=f"Created user: {req.username} ({req.role})")
@@ -497,40 +2531,38 @@ async def delete_user(user_id: str, user: dict = Depends(require_admin)):
     result = await db.panel_users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    await revocations.revoke(user_id)
     await audit_log("user_delete", user["username"], details=f"Deleted user: {user_id}")
     return {"status": "deleted"}
 
 # --- Analytics: Tickets per day for charts ---
 @api_router.get("/analytics/volume")
 async def get_volume(user: dict = Depends(get_current_user), days: int = 30):
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-    pipeline = [
-        {"$match": {"created_at": {"$gte": cutoff}}},
-        {"$group": {
-            "_id": {"$substr": ["$created_at", 0, 10]},
-            "opened": {"$sum": 1},
-            "closed": {"$sum": {"$cond": [{"$eq": ["$status", "closed"]}, 1, 0]}}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-    data = await db.tickets.aggregate(pipeline).to_list(60)
-    return {"volume": [{"date": d["_id"], "opened": d["opened"], "closed": d["closed"]} for d in data]}
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    data = await get_rollups("day", since=cutoff)
+    return {"volume": [{"date": d["key"], "opened": d.get("opened", 0), "closed": d.get("closed", 0)} for d in data if d.get("opened")]}
 
 @api_router.get("/analytics/priority_distribution")
 async def get_priority_dist(user: dict = Depends(get_current_user)):
-    pipeline = [
-        {"$group": {"_id": "$priority", "count": {"$sum": 1}}}
-    ]
-    data = await db.tickets.aggregate(pipeline).to_list(10)
-    return {"distribution": [{"priority": d["_id"], "count": d["count"]} for d in data]}
+    data = await get_rollups("priority")
+    return {"distribution": [{"priority": d["key"], "count": d["total"]} for d in data if d.get("total")]}
 
 @api_router.get("/analytics/type_distribution")
 async def get_type_dist(user: dict = Depends(get_current_user)):
-    pipeline = [
-        {"$group": {"_id": "$type", "count": {"$sum": 1}}}
-    ]
-    data = await db.tickets.aggregate(pipeline).to_list(20)
-    return {"distribution": [{"type": d["_id"], "count": d["count"]} for d in data]}
+    data = await get_rollups("type")
+    return {"distribution": [{"type": d["key"], "count": d["count"]} for d in data if d.get("count")]}
+
+@api_router.get("/admin/indexes")
+async def index_report(user: dict = Depends(require_admin)):
+    return {"query_shapes": await explain_query_shapes()}
+
+@api_router.post("/admin/rollups/rebuild")
+async def rebuild_rollups_route(user: dict = Depends(require_admin)):
+    count = await rebuild_rollups()
+    if count is None:
+        raise HTTPException(status_code=409, detail="A rollup rebuild is already running")
+    await audit_log("rollups_rebuild", user["username"], details=f"Rebuilt analytics rollups from {count} tickets")
+    return {"status": "rebuilt", "tickets": count}
 
 # --- Health ---
 @api_router.get("/health")
@@ -540,38 +2572,86 @@ async def health():
 # --- Settings Routes ---
 class SettingsUpdate(BaseModel):
     sla_first_response: Optional[int] = None
+    sla_first_response_by_priority: Optional[Dict[str, int]] = None
     sla_resolution: Optional[int] = None
     auto_close_hours: Optional[int] = None
     max_tickets_per_user: Optional[int] = None
     notification_email: Optional[str] = None
     discord_webhook: Optional[str] = None
 
+# Priorities missing from sla_first_response_by_priority fall back to sla_first_response
+class PanelSettings(BaseModel):
+    id: str = "global"
+    version: int = 0
+    sla_first_response: int = 30
+    sla_first_response_by_priority: Dict[str, int] = {}
+    sla_resolution: int = 240
+    auto_close_hours: int = 48
+    max_tickets_per_user: int = 3
+    notification_email: str = ""
+    discord_webhook: str = ""
+
+# Settings are read on hot paths (ticket creation, the SLA engine, the bot), so each worker keeps the
+# current document in memory. PUT /settings bumps its version and publishes settings_update on the event
+# bus; workers that see a newer version reload. The TTL refresh covers buses that don't span workers.
+class SettingsCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.value = PanelSettings()
+        self.loaded_at = 0.0
+        self.reloading = None
+
+    @property
+    def current(self) -> PanelSettings:
+        if time.monotonic() - self.loaded_at > self.ttl and (self.reloading is None or self.reloading.done()):
+            self.reloading = spawn(self.load())
+        return self.value
+
+    async def load(self) -> PanelSettings:
+        doc = await db.settings.find_one({"id": "global"}, {"_id": 0})
+        self.set(PanelSettings(**(doc or {})))
+        return self.value
+
+    def set(self, value: PanelSettings):
+        self.value = value
+        self.loaded_at = time.monotonic()
+
+    def notify(self, version: int):
+        if version > self.value.version and (self.reloading is None or self.reloading.done()):
+            self.reloading = spawn(self.load())
+
+settings_cache = SettingsCache(SETTINGS_CACHE_TTL)
+
 @api_router.get("/settings")
 async def get_settings(user: dict = Depends(get_current_user)):
-    settings = await db.settings.find_one({"id": "global"}, {"_id": 0})
-    if not settings:
-        settings = {
-            "id": "global",
-            "sla_first_response": 30,
-            "sla_resolution": 240,
-            "auto_close_hours": 48,
-            "max_tickets_per_user": 3,
-            "notification_email": "",
-            "discord_webhook": ""
-        }
-    return settings
+    return settings_cache.current
+
+@api_router.get("/bot/settings", dependencies=[Depends(verify_bot)])
+async def get_bot_settings():
+    return settings_cache.current.dict(exclude={"notification_email", "discord_webhook"})
 
 @api_router.put("/settings")
 async def update_settings(update: SettingsUpdate, user: dict = Depends(require_admin)):
     update_dict = {k: v for k, v in update.dict().items() if v is not None}
+    unknown = set(update_dict.get("sla_first_response_by_priority", {})) - set(TICKET_PRIORITIES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown priorities: {', '.join(sorted(unknown))}")
     if update_dict:
-        await db.settings.update_one(
+        doc = await db.settings.find_one_and_update(
             {"id": "global"},
-            {"$set": update_dict},
-            upsert=True
+            {"$set": update_dict, "$inc": {"version": 1}},
+            projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
         )
+        settings_cache.set(PanelSettings(**doc))
+        await push_event("settings_update", {"version": doc["version"], "user": user["username"], "fields": sorted(update_dict)})
         await audit_log("settings_update", user["username"], details=json.dumps(update_dict))
-    return {"status": "updated"}
+        if any(key.startswith("sla_") for key in update_dict):
+            # New thresholds: have the SLA engine re-evaluate every ticket that is still being tracked
+            await db.tickets.update_many(
+                {"sla_due_at": {"$ne": None}},
+                {"$set": {"sla_due_at": datetime.now(timezone.utc)}}
+            )
+    return {"status": "updated", "version": settings_cache.value.version}
 
 # --- PDF Download ---
 @api_router.get("/docs/download")
@@ -599,14 +2679,16 @@ app.add_middleware(
 # --- Startup: Seed Data ---
 @app.on_event("startup")
 async def startup():
-    # Create indexes
-    await db.tickets.create_index("id", unique=True)
-    await db.tickets.create_index("status")
-    await db.tickets.create_index("priority")
-    await db.tickets.create_index("created_at")
-    await db.panel_users.create_index("username", unique=True)
-    await db.audit_log.create_index("timestamp")
-    await db.live_events.create_index("timestamp")
+    await event_bus.start(deliver_events)
+    await settings_cache.load()
+    await revocations.load()
+    await datetime_migration.load()
+    audit_buffer.start()
+    event_buffer.start()
+
+    await ensure_indexes()
+    await ensure_audit_partitions()
+    spawn(index_advisor())
 
     # Create default admin if not exists
     admin = await db.panel_users.find_one({"username": "admin"})
@@ -615,9 +2697,9 @@ async def startup():
             await db.panel_users.insert_one({
                 "id": str(uuid.uuid4()),
                 "username": "admin",
-                "password_hash": hash_password("admin123"),
+                "password_hash": await hash_password("admin123"),
                 "role": "admin",
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         })
             logger.info("Default admin user created (admin/admin123)")
         except Exception as e:
@@ -632,6 +2714,18 @@ async def startup():
         await seed_demo_data()
         logger.info("Demo data seeded")
 
+    spawn(backfill_search_fields())
+    spawn(datetime_migration.run())
+    spawn(retention_job())
+    spawn(sla_engine())
+
+    # Backfill analytics rollups on first start, and again when their contributions changed
+    totals = await db.ticket_rollups.find_one({"_id": "total:all"}, {"version": 1})
+    if not totals or totals.get("version", 1) < ROLLUP_VERSION:
+        rebuilt = await rebuild_rollups()
+        if rebuilt is not None:
+            logger.info(f"Analytics rollups built from {rebuilt} tickets")
+
 async def seed_demo_data():
     import random
     types = ["general", "technical", "billing", "bug_report", "feature_request"]
@@ -666,10 +2760,9 @@ async def seed_demo_data():
         priority = random.choice(priorities)
         supporter = random.choice(supporters) if status != "open" else None
         created = now - timedelta(days=random.randint(0, 29), hours=random.randint(0, 23), minutes=random.randint(0, 59))
-        created_str = created.isoformat()
-        claimed_at = (created + timedelta(minutes=random.randint(2, 120))).isoformat() if supporter else None
-        first_resp = (created + timedelta(minutes=random.randint(3, 180))).isoformat() if supporter else None
-        closed_at = (created + timedelta(hours=random.randint(1, 72))).isoformat() if status == "closed" else None
+        claimed_at = created + timedelta(minutes=random.randint(2, 120)) if supporter else None
+        first_resp = created + timedelta(minutes=random.randint(3, 180)) if supporter else None
+        closed_at = created + timedelta(hours=random.randint(1, 72)) if status == "closed" else None
 
         tickets.append({
             "id": str(uuid.uuid4()),
@@ -683,7 +2776,7 @@ async def seed_demo_data():
             "priority": priority,
             "description": f"Demo ticket description #{i+1}",
             "status": status,
-            "created_at": created_str,
+            "created_at": created,
             "claimed_by": supporter,
             "claimed_at": claimed_at,
             "first_response_at": first_resp,
@@ -706,7 +2799,7 @@ async def seed_demo_data():
             "id": str(uuid.uuid4()),
             "event_type": random.choice(event_types),
             "data": {"ticket_id": tickets[i % len(tickets)]["id"], "username": tickets[i % len(tickets)]["username"], "subject": tickets[i % len(tickets)]["subject"]},
-            "timestamp": (now - timedelta(minutes=random.randint(1, 600))).isoformat()
+            "timestamp": now - timedelta(minutes=random.randint(1, 600))
         })
     if events:
         await db.live_events.insert_many(events)
@@ -715,11 +2808,20 @@ async def seed_demo_data():
     await db.panel_users.insert_one({
         "id": str(uuid.uuid4()),
         "username": "support",
-        "password_hash": hash_password("support123"),
+        "password_hash": await hash_password("support123"),
         "role": "support",
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     })
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in list(background_tasks):
+        task.cancel()
+    await release_lease("sla_engine")
+    await release_lease(datetime_migration.name)
+    await release_lease("retention")
+    await event_bus.stop()
+    await audit_buffer.stop()
+    await event_buffer.stop()
+    password_pool.shutdown(wait=False)
     client.close()
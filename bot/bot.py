@@ -6,13 +6,18 @@ Enterprise Discord Ticket Bot - Control Center X Ultra
 import os
 import asyncio
 import json
+import heapq
 import html
 import logging
+import random
+import sqlite3
+import time
+import uuid
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 import aiohttp
 from dotenv import load_dotenv
@@ -30,6 +35,18 @@ MAX_TICKETS_PER_USER = int(os.environ.get('MAX_TICKETS_PER_USER', '3'))
 SLA_MINUTES = int(os.environ.get('SLA_FIRST_RESPONSE_MINUTES', '30'))
 AUTO_CLOSE_HOURS = int(os.environ.get('AUTO_CLOSE_INACTIVE_HOURS', '48'))
 
+API_MAX_CONNECTIONS = int(os.environ.get('API_MAX_CONNECTIONS', '10'))
+API_TIMEOUT_SECONDS = float(os.environ.get('API_TIMEOUT_SECONDS', '10'))
+API_RETRIES = int(os.environ.get('API_RETRIES', '3'))
+API_BACKOFF_SECONDS = float(os.environ.get('API_BACKOFF_SECONDS', '0.5'))
+API_BATCH_SIZE = int(os.environ.get('API_BATCH_SIZE', '50'))
+
+BOT_DATA_DIR = Path(os.environ.get('BOT_DATA_DIR', Path(__file__).parent))
+OUTBOX_PATH = os.environ.get('OUTBOX_PATH', str(BOT_DATA_DIR / 'outbox.sqlite3'))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.environ.get('OUTBOX_MAX_BACKOFF_SECONDS', '60'))
+BOT_STATE_BACKEND = os.environ.get('BOT_STATE_BACKEND', 'sqlite')
+BOT_STATE_PATH = os.environ.get('BOT_STATE_PATH', str(BOT_DATA_DIR / 'state.sqlite3'))
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
 logger = logging.getLogger('TicketBot')
 
@@ -38,34 +55,611 @@ intents.members = True
 intents.presences = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
 
-user_tickets = {}
-ticket_data = {}
-last_ticket_time = {}
+class TicketBot(commands.Bot):
+    async def setup_hook(self):
+        outbox.start()
+        await state.warm()
+        await panel_settings.load()
+        panel_settings.start()
+        scheduler.start()
+
+    async def close(self):
+        await panel_settings.stop()
+        await scheduler.stop()
+        await outbox.stop()
+        await api.close()
+        await super().close()
+
+
+bot = TicketBot(command_prefix='!', intents=intents)
+
 RATE_LIMIT_SECONDS = 60
-ticket_counter = 0
 
 
-async def api_request(method, path, data=None):
-    headers = {'Content-Type': 'application/json', 'X-Bot-Token': TOKEN}
-    async with aiohttp.ClientSession() as session:
+# Single-item routes that can be coalesced into one POST of {"items": [...]}
+BATCH_ROUTES = {'/bot/message': '/bot/messages:batch', '/bot/event': '/bot/events:batch'}
+
+
+# Long-lived keep-alive session to the web panel with bounded concurrency and retries
+class ApiClient:
+    def __init__(self):
+        self.session = None
+        self.semaphore = asyncio.Semaphore(API_MAX_CONNECTIONS)
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=API_MAX_CONNECTIONS, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=API_TIMEOUT_SECONDS),
+                headers={'Content-Type': 'application/json', 'X-Bot-Token': TOKEN},
+            )
+        return self.session
+
+    async def send(self, method, path, data=None, headers=None):
+        # (status, body text) of the response; transport errors, 5xx and 429 are retried and give
+        # None once the retries are used up
         url = f"{API_URL}{path}"
-        logger.info(f"API Request: {method} {url}")
+        for attempt in range(API_RETRIES + 1):
+            try:
+                async with self.semaphore:
+                    async with self._get_session().request(method, url, json=data, headers=headers) as resp:
+                        if resp.status >= 500 or resp.status == 429:
+                            raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status, message=resp.reason)
+                        return resp.status, await resp.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == API_RETRIES:
+                    logger.error(f"API request failed: {method} {path}: {e}")
+                    return None
+                # Full jitter so a restarting backend isn't hit by every retry at once
+                delay = random.uniform(0, API_BACKOFF_SECONDS * 2 ** attempt)
+                logger.warning(f"API {method} {path} failed ({e}), retry {attempt + 1}/{API_RETRIES} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def request(self, method, path, data=None, headers=None):
+        response = await self.send(method, path, data, headers)
+        if response is None:
+            return None
+        status, body = response
         try:
-            if method == 'POST':
-                async with session.post(url, json=data, headers=headers) as resp:
-                    result = await resp.json()
-                    logger.info(f"API Response: {resp.status} - {result}")
-                    return result
-            elif method == 'GET':
-                async with session.get(url, headers=headers) as resp:
-                    result = await resp.json()
-                    logger.info(f"API Response: {resp.status} - {result}")
-                    return result
-        except Exception as e:
-            logger.error(f"API request failed: {e}")
+            result = json.loads(body) if body else None
+        except ValueError as e:
+            logger.error(f"API {method} {path} returned invalid JSON: {e}")
             return None
+        if status >= 400:
+            logger.warning(f"API {method} {path} -> {status}: {result}")
+        else:
+            logger.debug(f"API {method} {path} -> {status}")
+        return result
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+api = ApiClient()
+
+
+# Append-only on-disk log of every outbound write. Interactions only pay for a local SQLite insert;
+# a background task replays the log in order (batched where the backend allows) until each entry is
+# acknowledged, so backend restarts and deploys don't lose tickets or messages. Entries the backend
+# rejects (4xx) move to dead_letter and are put back into the outbox on the next start, so fixing the
+# cause (a wrong bot token, say) and restarting delivers them.
+class Outbox:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, idempotency_key TEXT NOT NULL, "
+            "path TEXT NOT NULL, payload TEXT NOT NULL, created_at TEXT NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "seq INTEGER PRIMARY KEY, idempotency_key TEXT NOT NULL, path TEXT NOT NULL, payload TEXT NOT NULL, "
+            "created_at TEXT NOT NULL, status INTEGER NOT NULL, response TEXT NOT NULL, failed_at TEXT NOT NULL)"
+        )
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def append(self, path, data):
+        key = str(uuid.uuid4())
+        self.db.execute(
+            "INSERT INTO outbox (idempotency_key, path, payload, created_at) VALUES (?, ?, ?, ?)",
+            (key, path, json.dumps(data), datetime.now(timezone.utc).isoformat()),
+        )
+        self.wakeup.set()
+        return key
+
+    def pending(self):
+        return self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _next_run(self):
+        # Oldest entry, plus the entries right after it for the same batchable route
+        rows = self.db.execute(
+            "SELECT seq, idempotency_key, path, payload FROM outbox ORDER BY seq LIMIT ?", (API_BATCH_SIZE,)
+        ).fetchall()
+        if not rows:
+            return []
+        run = [rows[0]]
+        if rows[0][2] in BATCH_ROUTES:
+            for row in rows[1:]:
+                if row[2] != rows[0][2]:
+                    break
+                run.append(row)
+        return run
+
+    def _ack(self, rows):
+        self.db.executemany("DELETE FROM outbox WHERE seq = ?", [(row[0],) for row in rows])
+
+    def _dead_letter(self, rows, status, body):
+        logger.error(f"Backend rejected {len(rows)} outbox entries for {rows[0][2]} with {status}: {body[:300]}; "
+                     f"moved to dead_letter ({self.dead_letters() + len(rows)} total), requeued on restart")
+        failed_at = datetime.now(timezone.utc).isoformat()
+        self.db.execute("BEGIN IMMEDIATE")
+        for row in rows:
+            self.db.execute(
+                "INSERT OR REPLACE INTO dead_letter (seq, idempotency_key, path, payload, created_at, status, response, failed_at) "
+                "SELECT seq, idempotency_key, path, payload, created_at, ?, ?, ? FROM outbox WHERE seq = ?",
+                (status, body[:2000], failed_at, row[0]),
+            )
+            self.db.execute("DELETE FROM outbox WHERE seq = ?", (row[0],))
+        self.db.execute("COMMIT")
+
+    def dead_letters(self):
+        return self.db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def requeue_dead_letters(self):
+        # Back in front of the queue under their original seq, so order is kept
+        self.db.execute("BEGIN IMMEDIATE")
+        count = self.db.execute(
+            "INSERT INTO outbox (seq, idempotency_key, path, payload, created_at) "
+            "SELECT seq, idempotency_key, path, payload, created_at FROM dead_letter"
+        ).rowcount
+        self.db.execute("DELETE FROM dead_letter")
+        self.db.execute("COMMIT")
+        if count:
+            logger.warning(f"Requeued {count} dead-lettered outbox entries")
+
+    async def _send(self, run):
+        path = run[0][2]
+        if path in BATCH_ROUTES:
+            items = []
+            for _, key, _, payload in run:
+                item = json.loads(payload)
+                item.setdefault('id', key)
+                items.append(item)
+            return await api.send('POST', BATCH_ROUTES[path], {'items': items})
+        _, key, _, payload = run[0]
+        return await api.send('POST', path, json.loads(payload), headers={'Idempotency-Key': key})
+
+    async def drain(self):
+        backoff = API_BACKOFF_SECONDS
+        while True:
+            run = self._next_run()
+            if not run:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            response = await self._send(run)
+            if response is None:
+                # Backend unreachable or failing: keep the entries and retry the same run later, preserving order
+                logger.warning(f"Outbox delivery failed, {self.pending()} entries pending; retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF_SECONDS)
+                continue
+            backoff = API_BACKOFF_SECONDS
+            status, body = response
+            if status < 400:
+                self._ack(run)
+            elif len(run) > 1 and status not in (401, 403):
+                # One bad item fails the whole batch: resend the run one entry at a time
+                for row in run:
+                    single = await self._send([row])
+                    if single is None:
+                        break
+                    if single[0] < 400:
+                        self._ack([row])
+                    else:
+                        self._dead_letter([row], *single)
+            else:
+                self._dead_letter(run, status, body)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.requeue_dead_letters()
+            self.task = asyncio.create_task(self.drain())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+outbox = Outbox(OUTBOX_PATH)
+
+
+async def api_request(method, path, data=None):
+    # Writes go through the outbox and are delivered asynchronously; reads hit the API directly
+    if method == 'POST':
+        outbox.append(path, data)
+        return None
+    return await api.request(method, path, data)
+
+
+# Ticket state backends. Tickets are the dicts sent to /bot/ticket plus an 'open' flag.
+class SqliteStateBackend:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS tickets ("
+            "channel_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, open INTEGER NOT NULL, data TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS tickets_user_open ON tickets (user_id, open);"
+            "CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, last_ticket_at TEXT);"
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+        )
+
+    async def open_tickets(self, user_id=None):
+        if user_id is None:
+            rows = self.db.execute("SELECT data FROM tickets WHERE open = 1").fetchall()
+        else:
+            rows = self.db.execute("SELECT data FROM tickets WHERE user_id = ? AND open = 1", (user_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def load_ticket(self, channel_id):
+        row = self.db.execute("SELECT data FROM tickets WHERE channel_id = ?", (channel_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def save_ticket(self, td):
+        self.db.execute(
+            "INSERT OR REPLACE INTO tickets (channel_id, user_id, open, data) VALUES (?, ?, ?, ?)",
+            (td['channel_id'], td['user_id'], int(td.get('open', True)), json.dumps(td)),
+        )
+
+    async def last_ticket_at(self, user_id):
+        row = self.db.execute("SELECT last_ticket_at FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    async def set_last_ticket_at(self, user_id, value):
+        self.db.execute("INSERT OR REPLACE INTO users (user_id, last_ticket_at) VALUES (?, ?)", (user_id, value))
+
+    async def counter(self, name, increment=0, seed=0):
+        # IMMEDIATE takes the write lock up front so two processes sharing the file never hand out the same number
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = MAX(value, ?) + ?",
+                (name, seed + increment, seed, increment),
+            )
+            value = self.db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return value
+
+
+class ApiStateBackend:
+    # Reads go straight to the backend; writes ride the outbox so they are durable and stay ordered
+    # behind the ticket they belong to. Transport failures raise ConnectionError so callers don't
+    # mistake an unreachable backend for missing state.
+    async def _get(self, path):
+        result = await api.request('GET', path)
+        if result is None:
+            raise ConnectionError(f"state backend unreachable: GET {path}")
+        return result
+
+    async def open_tickets(self, user_id=None):
+        path = '/bot/state/tickets' + (f'?user_id={user_id}' if user_id else '')
+        result = await self._get(path)
+        return [row['data'] for row in result.get('tickets', [])]
+
+    async def load_ticket(self, channel_id):
+        result = await self._get(f'/bot/state/tickets/{channel_id}')
+        return result.get('data')
+
+    async def save_ticket(self, td):
+        await api_request('POST', f"/bot/state/tickets/{td['channel_id']}", {'user_id': td['user_id'], 'open': td.get('open', True), 'data': td})
+
+    async def last_ticket_at(self, user_id):
+        return (await self._get(f'/bot/state/users/{user_id}')).get('last_ticket_at')
+
+    async def set_last_ticket_at(self, user_id, value):
+        await api_request('POST', f'/bot/state/users/{user_id}', {'last_ticket_at': value})
+
+    async def counter(self, name, increment=0, seed=0):
+        # The request id stays the same across the client's retries, so the backend applies the increment once
+        data = {'increment': increment, 'seed': seed, 'request_id': uuid.uuid4().hex}
+        result = await api.request('POST', f'/bot/state/counters/{name}', data)
+        if not result or 'value' not in result:
+            raise ConnectionError(f"state backend unreachable: counter {name}")
+        return result['value']
+
+
+# Warm in-memory view over the state backend. Open tickets are loaded on startup, anything else is
+# hydrated per channel/user on first use, and every change is written through before it is cached.
+class StateStore:
+    def __init__(self, backend):
+        self.backend = backend
+        self.tickets = {}
+        self.misses = set()
+        self.user_tickets = {}
+        self.last_ticket_time = {}
+        self.counter = 0
+
+    def _cache(self, td):
+        channel_id = int(td['channel_id'])
+        self.misses.discard(channel_id)
+        if td.get('open', True):
+            self.tickets[channel_id] = td
+        else:
+            self.tickets.pop(channel_id, None)
+        user_id = int(td['user_id'])
+        if user_id in self.user_tickets:
+            channels = self.user_tickets[user_id]
+            if td.get('open', True) and channel_id not in channels:
+                channels.append(channel_id)
+            elif not td.get('open', True) and channel_id in channels:
+                channels.remove(channel_id)
+
+    async def warm(self):
+        try:
+            tickets = await self.backend.open_tickets()
+        except ConnectionError as e:
+            logger.warning(f"Could not warm ticket state, hydrating lazily: {e}")
+            return
+        for td in tickets:
+            self.user_tickets.setdefault(int(td['user_id']), [])
+            self._cache(td)
+        logger.info(f"Loaded {len(tickets)} open tickets from {BOT_STATE_BACKEND} state")
+
+    async def get_ticket(self, channel_id):
+        if channel_id in self.tickets:
+            return self.tickets[channel_id]
+        if channel_id in self.misses:
+            return None
+        try:
+            td = await self.backend.load_ticket(str(channel_id))
+        except ConnectionError as e:
+            logger.warning(f"Ticket state for {channel_id} unavailable: {e}")
+            return None
+        if td is None:
+            self.misses.add(channel_id)
+        else:
+            self._cache(td)
+        return td
+
+    async def save_ticket(self, td):
+        await self.backend.save_ticket(td)
+        self._cache(td)
+
+    async def set_open(self, td, is_open):
+        td['open'] = is_open
+        await self.save_ticket(td)
+
+    # The limit checks below raise ConnectionError when the backend can't answer; callers refuse the
+    # action rather than let it bypass the ticket-per-user limit or the cooldown
+    async def open_tickets(self, user_id):
+        if user_id not in self.user_tickets:
+            tickets = await self.backend.open_tickets(str(user_id))
+            self.user_tickets[user_id] = []
+            for td in tickets:
+                self._cache(td)
+        return self.user_tickets[user_id]
+
+    async def get_last_ticket_time(self, user_id):
+        if user_id not in self.last_ticket_time:
+            value = await self.backend.last_ticket_at(str(user_id))
+            self.last_ticket_time[user_id] = datetime.fromisoformat(value) if value else None
+        return self.last_ticket_time[user_id]
+
+    async def set_last_ticket_time(self, user_id, when):
+        await self.backend.set_last_ticket_at(str(user_id), when.isoformat())
+        self.last_ticket_time[user_id] = when
+
+    async def next_ticket_number(self):
+        try:
+            self.counter = await self.backend.counter('ticket', increment=1)
+        except ConnectionError as e:
+            self.counter += 1
+            logger.warning(f"Ticket counter unavailable, using local value {self.counter}: {e}")
+        return self.counter
+
+    async def seed_counter(self, value):
+        try:
+            self.counter = await self.backend.counter('ticket', seed=value)
+        except ConnectionError as e:
+            self.counter = max(self.counter, value)
+            logger.warning(f"Could not seed ticket counter: {e}")
+
+
+state = StateStore(ApiStateBackend() if BOT_STATE_BACKEND == 'api' else SqliteStateBackend(BOT_STATE_PATH))
+
+
+# Panel settings as seen by the bot. Loaded from /bot/settings and reloaded whenever the backend's event
+# stream announces a newer version (and on every reconnect, in case one was missed). The config.env
+# values apply until the first load succeeds.
+class SettingsClient:
+    def __init__(self):
+        self.values = {
+            'version': -1,
+            'sla_first_response': SLA_MINUTES,
+            'sla_first_response_by_priority': {},
+            'auto_close_hours': AUTO_CLOSE_HOURS,
+            'max_tickets_per_user': MAX_TICKETS_PER_USER,
+        }
+        self.task = None
+
+    @property
+    def version(self):
+        return self.values['version']
+
+    @property
+    def auto_close_hours(self):
+        return self.values['auto_close_hours']
+
+    @property
+    def max_tickets_per_user(self):
+        return self.values['max_tickets_per_user']
+
+    def sla_minutes(self, priority):
+        return self.values['sla_first_response_by_priority'].get(priority) or self.values['sla_first_response']
+
+    async def load(self):
+        result = await api.request('GET', '/bot/settings')
+        if not result or 'version' not in result:
+            logger.warning("Could not load settings from the API, keeping current values")
+            return False
+        changed = any(self.values.get(k) != v for k, v in result.items())
+        self.values.update(result)
+        return changed
+
+    async def reload(self):
+        if await self.load():
+            logger.info(f"Settings version {self.version} loaded")
+            if bot.is_ready():
+                schedule_open_tickets()
+
+    async def watch(self):
+        backoff = API_BACKOFF_SECONDS
+        while True:
+            try:
+                # The server sends a heartbeat every 30s, so a silent connection is a dead one
+                timeout = aiohttp.ClientTimeout(total=None, sock_read=90)
+                async with api._get_session().get(f"{API_URL}/events", timeout=timeout) as resp:
+                    resp.raise_for_status()
+                    backoff = API_BACKOFF_SECONDS
+                    await self.reload()
+                    async for line in resp.content:
+                        if not line.startswith(b'data: '):
+                            continue
+                        event = json.loads(line[6:])
+                        if event.get('event_type') == 'settings_update' and event['data'].get('version', 0) > self.version:
+                            await self.reload()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Event stream disconnected ({e}), reconnecting in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF_SECONDS)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.watch())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+panel_settings = SettingsClient()
+
+
+# Deadline scheduler for SLA warnings and inactivity auto-close. Deadlines live in a min-heap and the
+# runner sleeps until the earliest one (or until something is scheduled earlier). Cancelling or
+# rescheduling just replaces the entry in `due`; superseded heap items are skipped when popped.
+class DeadlineScheduler:
+    def __init__(self):
+        self.heap = []
+        self.due = {}
+        self.queued = {}  # key -> time of the key's earliest heap entry
+        self.seq = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def schedule(self, kind, channel_id, when):
+        key = (kind, channel_id)
+        at = when.timestamp()
+        self.due[key] = at
+        # A later deadline (every message pushes auto-close back) reuses the queued entry: it is
+        # requeued at the new time when it comes up. Only earlier deadlines need a new entry.
+        if self.queued.get(key, float('inf')) <= at:
+            return
+        self.push(key, at)
+        if self.heap[0][2] == key:
+            self.wakeup.set()
+
+    def push(self, key, at):
+        self.queued[key] = at
+        self.seq += 1
+        heapq.heappush(self.heap, (at, self.seq, key))
+
+    def pop(self):
+        at, _, key = heapq.heappop(self.heap)
+        if self.queued.get(key) == at:
+            del self.queued[key]
+        return at, key
+
+    def cancel(self, kind, channel_id):
+        self.due.pop((kind, channel_id), None)
+
+    def schedule_sla(self, td):
+        if td.get('claimed_by') or td.get('sla_warned'):
+            return
+        created = datetime.fromisoformat(td['created_at'])
+        self.schedule('sla', int(td['channel_id']), created + timedelta(minutes=panel_settings.sla_minutes(td.get('priority'))))
+
+    def schedule_auto_close(self, channel_id, last_activity):
+        if panel_settings.auto_close_hours:
+            self.schedule('auto_close', channel_id, last_activity + timedelta(hours=panel_settings.auto_close_hours))
+
+    def cancel_ticket(self, channel_id):
+        self.cancel('sla', channel_id)
+        self.cancel('auto_close', channel_id)
+
+    async def run(self):
+        while True:
+            while self.heap and self.due.get(self.heap[0][2]) != self.heap[0][0]:
+                _, key = self.pop()
+                if key in self.due and key not in self.queued:
+                    self.push(key, self.due[key])
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, key = self.pop()
+            del self.due[key]
+            kind, channel_id = key
+            try:
+                if kind == 'sla':
+                    await sla_warning(channel_id)
+                else:
+                    await auto_close(channel_id)
+            except Exception as e:
+                logger.error(f"Scheduled {kind} for {channel_id} failed: {e}")
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+scheduler = DeadlineScheduler()
 
 
 def is_support(member):
@@ -101,20 +695,25 @@ class TicketModal(discord.ui.Modal):
         self.add_item(self.description)
 
     async def on_submit(self, interaction):
-        global ticket_counter
         user = interaction.user
         guild = interaction.guild
         now = datetime.now(timezone.utc)
 
-        if user.id in last_ticket_time:
-            diff = (now - last_ticket_time[user.id]).total_seconds()
+        try:
+            last_ticket_time = await state.get_last_ticket_time(user.id)
+            active = await state.open_tickets(user.id)
+        except ConnectionError as e:
+            logger.warning(f"Ticket limits for {user.id} unavailable, refusing ticket: {e}")
+            await interaction.response.send_message("Tickets can't be opened right now, please try again in a minute.", ephemeral=True)
+            return
+        if last_ticket_time:
+            diff = (now - last_ticket_time).total_seconds()
             if diff < RATE_LIMIT_SECONDS:
                 await interaction.response.send_message(f"Please wait {int(RATE_LIMIT_SECONDS - diff)}s", ephemeral=True)
                 return
 
-        active = user_tickets.get(user.id, [])
-        if len(active) >= MAX_TICKETS_PER_USER:
-            await interaction.response.send_message(f"You already have {MAX_TICKETS_PER_USER} open tickets.", ephemeral=True)
+        if len(active) >= panel_settings.max_tickets_per_user:
+            await interaction.response.send_message(f"You already have {panel_settings.max_tickets_per_user} open tickets.", ephemeral=True)
             return
 
         await interaction.response.defer(ephemeral=True)
@@ -130,7 +729,7 @@ class TicketModal(discord.ui.Modal):
             if role:
                 overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
 
-        ticket_counter += 1
+        ticket_counter = await state.next_ticket_number()
         lang_prefix = "de" if self.lang == "de" else "en"
         channel_name = f"{lang_prefix}-ticket-{self.priority}-{ticket_counter:04d}"
 
@@ -148,10 +747,12 @@ class TicketModal(discord.ui.Modal):
             'description': self.description.value,
             'created_at': now.isoformat(),
             'claimed_by': None,
+            'open': True,
         }
-        ticket_data[channel.id] = td
-        user_tickets.setdefault(user.id, []).append(channel.id)
-        last_ticket_time[user.id] = now
+        await state.save_ticket(td)
+        await state.set_last_ticket_time(user.id, now)
+        scheduler.schedule_sla(td)
+        scheduler.schedule_auto_close(channel.id, now)
 
         await api_request('POST', '/bot/ticket', td)
 
@@ -192,7 +793,7 @@ class TicketActions(discord.ui.View):
         if not is_support(interaction.user):
             await interaction.response.send_message("No permission.", ephemeral=True)
             return
-        td = ticket_data.get(interaction.channel.id)
+        td = await state.get_ticket(interaction.channel.id)
         if not td:
             await interaction.response.send_message("Ticket not found.", ephemeral=True)
             return
@@ -200,6 +801,8 @@ class TicketActions(discord.ui.View):
             await interaction.response.send_message(f"Already claimed by {td['claimed_by']}.", ephemeral=True)
             return
         td['claimed_by'] = interaction.user.display_name
+        await state.save_ticket(td)
+        scheduler.cancel('sla', interaction.channel.id)
         await api_request('POST', '/bot/event', {'event_type': 'ticket_claim', 'data': {'ticket_id': td['channel_id'], 'claimed_by': interaction.user.display_name}})
         embed = discord.Embed(description=f"Claimed by **{interaction.user.display_name}**", color=discord.Color.gold())
         await interaction.response.send_message(embed=embed)
@@ -214,16 +817,13 @@ class TicketActions(discord.ui.View):
         if not is_support(interaction.user):
             await interaction.response.send_message("No permission.", ephemeral=True)
             return
-        td = ticket_data.get(interaction.channel.id)
+        td = await state.get_ticket(interaction.channel.id)
         if not td:
             await interaction.response.send_message("Ticket not found.", ephemeral=True)
             return
         await interaction.response.defer()
-        user_id = td.get('user_id')
-        if user_id:
-            uid = int(user_id)
-            if uid in user_tickets and interaction.channel.id in user_tickets.get(uid, []):
-                user_tickets[uid].remove(interaction.channel.id)
+        await state.set_open(td, False)
+        scheduler.cancel_ticket(interaction.channel.id)
         
         embed = discord.Embed(description=f"Ticket closed by **{interaction.user.display_name}**. Channel will be deleted in 5 seconds.", color=discord.Color.green())
         await interaction.followup.send(embed=embed)
@@ -237,11 +837,10 @@ class TicketActions(discord.ui.View):
         if not is_support(interaction.user):
             await interaction.response.send_message("No permission.", ephemeral=True)
             return
-        td = ticket_data.get(interaction.channel.id)
+        td = await state.get_ticket(interaction.channel.id)
         if td:
-            uid = int(td.get('user_id', 0))
-            if uid:
-                user_tickets.setdefault(uid, []).append(interaction.channel.id)
+            await state.set_open(td, True)
+            scheduler.schedule_auto_close(interaction.channel.id, datetime.now(timezone.utc))
         name = interaction.channel.name.replace("closed-", "")
         await interaction.channel.edit(name=name)
         embed = discord.Embed(description=f"Ticket reopened by **{interaction.user.display_name}**", color=discord.Color.blue())
@@ -263,19 +862,43 @@ class TicketPanelView(discord.ui.View):
         await interaction.response.send_message("Please select priority:", view=view, ephemeral=True)
 
 
-@tasks.loop(minutes=5)
-async def sla_check():
-    now = datetime.now(timezone.utc)
-    for channel_id, td in list(ticket_data.items()):
+def schedule_open_tickets():
+    # Deadlines are rebuilt from state; the last message in each channel stands in for the last activity
+    for channel_id, td in list(state.tickets.items()):
+        scheduler.cancel_ticket(channel_id)
+        scheduler.schedule_sla(td)
         channel = bot.get_channel(channel_id)
-        if not channel:
-            continue
-        created = datetime.fromisoformat(td['created_at'])
-        age_minutes = (now - created).total_seconds() / 60
-        if not td.get('claimed_by') and age_minutes > SLA_MINUTES and not td.get('sla_warned'):
-            td['sla_warned'] = True
-            embed = discord.Embed(description=f"SLA Warning: {int(age_minutes)} minutes without response!", color=discord.Color.red())
-            await channel.send(embed=embed)
+        last_activity = datetime.fromisoformat(td['created_at'])
+        if channel and channel.last_message_id:
+            last_activity = max(last_activity, discord.utils.snowflake_time(channel.last_message_id))
+        scheduler.schedule_auto_close(channel_id, last_activity)
+
+
+async def sla_warning(channel_id):
+    td = state.tickets.get(channel_id)
+    channel = bot.get_channel(channel_id)
+    if not td or not channel or td.get('claimed_by') or td.get('sla_warned'):
+        return
+    td['sla_warned'] = True
+    await state.save_ticket(td)
+    age_minutes = (datetime.now(timezone.utc) - datetime.fromisoformat(td['created_at'])).total_seconds() / 60
+    embed = discord.Embed(description=f"SLA Warning: {int(age_minutes)} minutes without response!", color=discord.Color.red())
+    await channel.send(embed=embed)
+
+
+async def auto_close(channel_id):
+    td = state.tickets.get(channel_id)
+    channel = bot.get_channel(channel_id)
+    if not td or not channel:
+        return
+    hours = panel_settings.auto_close_hours
+    await state.set_open(td, False)
+    scheduler.cancel_ticket(channel_id)
+    embed = discord.Embed(description=f"Ticket closed automatically after {hours} hours of inactivity. Channel will be deleted in 5 seconds.", color=discord.Color.green())
+    await channel.send(embed=embed)
+    await api_request('POST', '/bot/event', {'event_type': 'ticket_close', 'data': {'ticket_id': td['channel_id'], 'closed_by': 'auto-close'}})
+    await asyncio.sleep(5)
+    await channel.delete(reason=f"Ticket inactive for {hours} hours")
 
 
 @bot.event
@@ -283,9 +906,13 @@ async def on_message(message):
     if message.author.bot:
         return
     
-    if message.channel.id in ticket_data:
+    td = None
+    if getattr(message.channel, 'category_id', None) == TICKET_CATEGORY_ID:
+        td = await state.get_ticket(message.channel.id)
+    if td:
         msg_data = {
-            'ticket_id': ticket_data[message.channel.id]['channel_id'],
+            'id': str(message.id),
+            'ticket_id': td['channel_id'],
             'author': message.author.display_name,
             'author_id': str(message.author.id),
             'content': message.content,
@@ -293,13 +920,13 @@ async def on_message(message):
             'attachments': [att.url for att in message.attachments]
         }
         await api_request('POST', '/bot/message', msg_data)
+        scheduler.schedule_auto_close(message.channel.id, message.created_at)
     
     await bot.process_commands(message)
 
 
 @bot.event
 async def on_ready():
-    global ticket_counter
     logger.info(f'Logged in as {bot.user}')
     bot.add_view(TicketPanelView())
     bot.add_view(TicketActions())
@@ -307,9 +934,8 @@ async def on_ready():
     if guild:
         category = guild.get_channel(TICKET_CATEGORY_ID)
         if category:
-            for ch in category.channels:
-                if 'ticket' in ch.name.lower():
-                    ticket_counter += 1
+            # Only raises the stored counter, e.g. on the first start after moving to a fresh state store
+            await state.seed_counter(sum(1 for ch in category.channels if 'ticket' in ch.name.lower()))
     try:
         g = discord.Object(id=GUILD_ID)
         bot.tree.copy_global_to(guild=g)
@@ -317,7 +943,7 @@ async def on_ready():
         logger.info(f'Synced {len(synced)} commands to guild {GUILD_ID}')
     except Exception as e:
         logger.error(f'Failed to sync commands: {e}')
-    sla_check.start()
+    schedule_open_tickets()
 
 
 @bot.tree.command(name="ticket-panel", description="Create ticket panel")
@@ -79,7 +79,8 @@ pip install \
     python-dotenv \
     discord.py aiohttp \
     python-multipart \
-    sse-starlette
+    sse-starlette \
+    redis
 
 echo -e "${GREEN}[7/12] Creating configuration files...${NC}"
 
@@ -91,6 +92,8 @@ MONGO_URL=mongodb://localhost:27017
 DB_NAME=$DB_NAME
 JWT_SECRET=$JWT_SECRET
 CORS_ORIGINS=https://$DOMAIN
+EVENT_BUS=redis
+REDIS_URL=redis://localhost:6379/0
 DISCORD_BOT_TOKEN=CHANGE_ME
 DISCORD_GUILD_ID=1407623359365120090
 TICKET_CHANNEL_ID=1469120567532847225
@@ -193,6 +193,7 @@ pip install -q \
     discord.py==2.4.0 \
     aiohttp==3.11.11 \
     python-multipart==0.0.20 \
+    redis==5.2.1 \
     sse-starlette==2.2.1 \
     starlette==0.45.2
 
@@ -214,6 +215,10 @@ JWT_SECRET=$JWT_SECRET
 # CORS Origins (Ihre Domain)
 CORS_ORIGINS=https://$DOMAIN,http://localhost:3000
 
+# Live-Events zwischen allen Uvicorn Workern verteilen
+EVENT_BUS=redis
+REDIS_URL=redis://localhost:6379/0
+
 # Discord Bot Token (WICHTIG: Ändern Sie dies!)
 DISCORD_BOT_TOKEN=YOUR_BOT_TOKEN_HERE
 
@@ -40,7 +40,8 @@ function LiveChat({ user }) {
 
   const connectSSE = () => {
     try {
-      const eventSource = new EventSource(`${API_URL}/api/events`);
+      const token = localStorage.getItem('armesa_token');
+      const eventSource = new EventSource(`${API_URL}/api/events?token=${encodeURIComponent(token)}`);
       eventSourceRef.current = eventSource;
 
       eventSource.onopen = () => {
@@ -80,6 +81,12 @@ function LiveChat({ user }) {
       case 'ticket_close': return 'fa-check-circle';
       case 'escalation': return 'fa-exclamation-triangle';
       case 'notes_update': return 'fa-edit';
+      case 'ticket_update': return 'fa-edit';
+      case 'ticket_reopen': return 'fa-undo';
+      case 'message_batch': return 'fa-comments';
+      case 'sla_breach': return 'fa-stopwatch';
+      case 'settings_update': return 'fa-cog';
+      case 'user_revoked': return 'fa-user-slash';
       default: return 'fa-info-circle';
     }
   };
@@ -90,6 +97,7 @@ function LiveChat({ user }) {
       case 'ticket_claim': return 'event-claimed';
       case 'ticket_close': return 'event-closed';
       case 'escalation': return 'event-escalated';
+      case 'sla_breach': return 'event-escalated';
       default: return 'event-default';
     }
   };
@@ -101,6 +109,12 @@ function LiveChat({ user }) {
       case 'ticket_close': return 'Geschlossen';
       case 'escalation': return 'Eskaliert';
       case 'notes_update': return 'Notiz aktualisiert';
+      case 'ticket_update': return 'Ticket aktualisiert';
+      case 'ticket_reopen': return 'Wiedereröffnet';
+      case 'message_batch': return 'Neue Nachrichten';
+      case 'sla_breach': return 'SLA verletzt';
+      case 'settings_update': return 'Einstellungen geändert';
+      case 'user_revoked': return 'Zugang entzogen';
       default: return type;
     }
   };
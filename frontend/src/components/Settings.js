@@ -7,6 +7,7 @@ const API_URL = process.env.REACT_APP_BACKEND_URL;
 function Settings({ user }) {
   const [settings, setSettings] = useState({
     sla_first_response: 30,
+    sla_first_response_by_priority: {},
     sla_resolution: 240,
     auto_close_hours: 48,
     max_tickets_per_user: 3,
@@ -57,6 +58,18 @@ function Settings({ user }) {
     setSettings(prev => ({ ...prev, [key]: value }));
   };
 
+  const handlePrioritySlaChange = (priority, value) => {
+    setSettings(prev => {
+      const byPriority = { ...prev.sla_first_response_by_priority };
+      if (Number.isNaN(value)) {
+        delete byPriority[priority];
+      } else {
+        byPriority[priority] = value;
+      }
+      return { ...prev, sla_first_response_by_priority: byPriority };
+    });
+  };
+
   if (loading) {
     return <div className="loading">Laden...</div>;
   }
@@ -91,6 +104,19 @@ function Settings({ user }) {
               />
               <span className="help-text">Zeit bis zur ersten Antwort auf ein Ticket</span>
             </div>
+            {['critical', 'high', 'medium', 'low'].map((priority) => (
+              <div className="form-group" key={priority}>
+                <label>Erste Antwort {priority.toUpperCase()} (Minuten)</label>
+                <input
+                  type="number"
+                  value={settings.sla_first_response_by_priority?.[priority] ?? ''}
+                  placeholder={settings.sla_first_response}
+                  onChange={(e) => handlePrioritySlaChange(priority, parseInt(e.target.value))}
+                  min="1"
+                  data-testid={`sla-first-response-${priority}-input`}
+                />
+              </div>
+            ))}
             <div className="form-group">
               <label>Lösungszeit (Minuten)</label>
               <input
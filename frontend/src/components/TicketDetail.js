@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { useParams, useNavigate } from 'react-router-dom';
 import '../styles/TicketDetail.css';
@@ -13,12 +13,35 @@ function TicketDetail({ user }) {
   const [loading, setLoading] = useState(true);
   const [newNote, setNewNote] = useState('');
   const [updating, setUpdating] = useState(false);
+  const cursorRef = useRef(null);
+  const fetchingRef = useRef(false);
+  const refetchRef = useRef(false);
 
   useEffect(() => {
+    setMessages([]);
+    cursorRef.current = null;
     fetchTicket();
     fetchMessages();
-    const interval = setInterval(fetchMessages, 5000); // Refresh every 5 seconds
-    return () => clearInterval(interval);
+    // New messages and ticket changes arrive as events for this ticket; polling only covers missed ones
+    const token = localStorage.getItem('armesa_token');
+    const eventSource = new EventSource(`${API_URL}/api/events?ticket_id=${ticketId}&token=${encodeURIComponent(token)}`);
+    eventSource.onmessage = (event) => {
+      try {
+        const data = JSON.parse(event.data);
+        if (data.event_type === 'ticket_message') {
+          fetchMessages();
+        } else if (data.event_type !== 'heartbeat') {
+          fetchTicket();
+        }
+      } catch (e) {
+        console.error('Error parsing SSE event:', e);
+      }
+    };
+    const interval = setInterval(fetchMessages, 30000);
+    return () => {
+      eventSource.close();
+      clearInterval(interval);
+    };
   }, [ticketId]);
 
   const fetchTicket = async () => {
@@ -35,15 +58,37 @@ function TicketDetail({ user }) {
     }
   };
 
+  // Fetches only messages after the last one loaded, page by page
   const fetchMessages = async () => {
+    if (fetchingRef.current) {
+      refetchRef.current = true;
+      return;
+    }
+    fetchingRef.current = true;
     try {
       const token = localStorage.getItem('armesa_token');
-      const response = await axios.get(`${API_URL}/api/tickets/${ticketId}/messages`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setMessages(response.data.messages || []);
+      let more = true;
+      while (more) {
+        const params = new URLSearchParams({ limit: '200' });
+        if (cursorRef.current) params.set('cursor', cursorRef.current);
+        const response = await axios.get(`${API_URL}/api/tickets/${ticketId}/messages?${params}`, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        const page = response.data.messages || [];
+        if (page.length > 0) {
+          setMessages(prev => [...prev, ...page]);
+        }
+        cursorRef.current = response.data.latest_cursor || cursorRef.current;
+        more = Boolean(response.data.next_cursor);
+      }
     } catch (error) {
       console.error('Error fetching messages:', error);
+    } finally {
+      fetchingRef.current = false;
+      if (refetchRef.current) {
+        refetchRef.current = false;
+        fetchMessages();
+      }
     }
   };
 
@@ -63,6 +108,25 @@ function TicketDetail({ user }) {
     }
   };
 
+  const downloadTranscript = async () => {
+    try {
+      const token = localStorage.getItem('armesa_token');
+      const response = await axios.get(`${API_URL}/api/tickets/${ticketId}/transcript`, {
+        headers: { Authorization: `Bearer ${token}` },
+        responseType: 'blob'
+      });
+      const url = URL.createObjectURL(response.data);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `ticket-${ticketId.substring(0, 8)}.html`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error('Error downloading transcript:', error);
+      alert('Transkript konnte nicht geladen werden');
+    }
+  };
+
   const addNote = async () => {
     if (!newNote.trim()) return;
     await updateTicket({ notes: newNote });
@@ -84,6 +148,11 @@ function TicketDetail({ user }) {
           <i className="fas fa-arrow-left"></i> Zurück
         </button>
         <h1>Ticket #{ticket.id ? ticket.id.substring(0, 8) : 'N/A'}</h1>
+        {ticket.transcript_path && (
+          <button onClick={downloadTranscript} className="btn btn-secondary" data-testid="download-transcript-btn">
+            <i className="fas fa-file-download"></i> Transkript
+          </button>
+        )}
       </div>
 
       <div className="detail-grid">
@@ -117,7 +117,7 @@ function TicketList({ user }) {
             </div>
             
             <h3 className="ticket-subject">{ticket.subject}</h3>
-            <p className="ticket-description">{(ticket.description || '').substring(0, 100)}...</p>
+            <p className="ticket-description">{(ticket.description_preview ?? ticket.description ?? '').substring(0, 100)}...</p>
             
             <div className="ticket-card-footer">
               <div className="ticket-meta">
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'control_center_test')
+os.environ.setdefault('JWT_SECRET', 'test-secret-' + 'x' * 32)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
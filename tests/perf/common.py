@@ -0,0 +1,100 @@
+# Shared setup for the benchmarks in tests/perf. They run against the server at MONGO_URL in a throwaway
+# database and skip when none is reachable; PERF_TICKETS sets the data size. Run with -s to see timings.
+import os
+import random
+import statistics
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+from pymongo.errors import PyMongoError
+
+import server
+
+PERF_TICKETS = int(os.environ.get("PERF_TICKETS", "20000"))
+PERF_RUNS = int(os.environ.get("PERF_RUNS", "50"))
+
+WORDS = ["voice", "channel", "role", "permission", "webhook", "bot", "music", "backup", "spam", "ranking",
+         "emoji", "upload", "welcome", "message", "nitro", "booster", "event", "api", "access", "sync"]
+
+
+@asynccontextmanager
+async def perf_database(monkeypatch):
+    client = motor_asyncio.AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000, tz_aware=True)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"No MongoDB server at MONGO_URL: {e}")
+    name = f"perf_{uuid.uuid4().hex[:8]}"
+    db = client[name]
+    monkeypatch.setattr(server, "db", db)
+    try:
+        await server.ensure_indexes()
+        yield db
+    finally:
+        await client.drop_database(name)
+        client.close()
+
+
+def make_ticket(i: int, now: datetime) -> dict:
+    rng = random.Random(i)
+    status = rng.choices(["open", "claimed", "closed", "escalated"], weights=[25, 20, 45, 10])[0]
+    created = now - timedelta(days=rng.randint(0, 89), minutes=rng.randint(0, 1439))
+    claimed = status != "open"
+    ticket = {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "channel_id": str(10 ** 17 + i),
+        "user_id": str(10 ** 17 + rng.randint(0, PERF_TICKETS // 5)),
+        "username": f"user{rng.randint(0, PERF_TICKETS // 5)}",
+        "subject": " ".join(rng.sample(WORDS, 3)),
+        "type": rng.choice(["general", "technical", "billing", "bug_report", "feature_request"]),
+        "lang": rng.choice(["de", "en"]),
+        "priority": rng.choice(["low", "medium", "high", "critical"]),
+        "description": " ".join(rng.choices(WORDS, k=40)),
+        "status": status,
+        "created_at": created,
+        "claimed_by": f"supporter{rng.randint(0, 9)}" if claimed else None,
+        "claimed_at": created + timedelta(minutes=rng.randint(1, 120)) if claimed else None,
+        "first_response_at": created + timedelta(minutes=rng.randint(1, 180)) if claimed else None,
+        "closed_at": created + timedelta(hours=rng.randint(1, 72)) if status == "closed" else None,
+        "escalation_flag": status == "escalated",
+        "sla_breached": rng.random() < 0.15,
+        "notes": "",
+        "version": 0,
+    }
+    ticket.update(server.search_fields(ticket))
+    ticket.update(server.summary_fields(ticket))
+    return ticket
+
+
+async def seed_tickets(db, n: int = PERF_TICKETS) -> list:
+    now = datetime.now(timezone.utc)
+    tickets = [make_ticket(i, now) for i in range(n)]
+    for start in range(0, n, 5000):
+        await db.tickets.insert_many([dict(t) for t in tickets[start:start + 5000]], ordered=False)
+    return tickets
+
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {"p50": statistics.median(samples), "p95": samples[max(0, int(len(samples) * 0.95) - 1)], "max": samples[-1]}
+
+
+async def timed(fn, runs: int = PERF_RUNS) -> dict:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def report(title: str, results: dict):
+    print(f"\n{title}")
+    for name, stats in results.items():
+        print(f"  {name:<28} p50 {stats['p50']:9.2f} ms   p95 {stats['p95']:9.2f} ms   max {stats['max']:9.2f} ms")
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+from tests.perf.common import PERF_TICKETS, make_ticket, perf_database, report, timed
+
+PAGES = 5
+
+
+async def created_last_week(db) -> int:
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    return await db.tickets.count_documents(server.time_cond("created_at", "$gte", since))
+
+
+async def volume_by_day(db, day) -> list:
+    return await db.tickets.aggregate([
+        {"$group": {"_id": day, "opened": {"$sum": 1}}},
+        {"$sort": {"_id": 1}}
+    ]).to_list(None)
+
+
+async def walk_pages(db) -> list:
+    ids, cursor = [], None
+    for _ in range(PAGES):
+        page = await server.paginate(db.tickets, {}, "created_at", -1, 50, cursor=cursor, total_mode="none")
+        ids.extend(t["id"] for t in page["items"])
+        cursor = page["next_cursor"]
+    return ids
+
+
+async def measure(db, day) -> dict:
+    return {
+        "count": await created_last_week(db),
+        "volume": await volume_by_day(db, day),
+        "pages": await walk_pages(db),
+        "timings": {
+            "created in the last 7 days": await timed(lambda: created_last_week(db)),
+            "tickets per day": await timed(lambda: volume_by_day(db, day)),
+            f"first {PAGES} ticket pages": await timed(lambda: walk_pages(db)),
+        },
+    }
+
+
+def test_string_and_bson_timestamps(monkeypatch):
+    monkeypatch.setattr(server, "DATETIME_MIGRATION_PAUSE", 0)
+    monkeypatch.setattr(server.datetime_migration, "checked_at", float("inf"))
+
+    async def scenario():
+        async with perf_database(monkeypatch) as db:
+            now = datetime.now(timezone.utc)
+            tickets = [make_ticket(i, now) for i in range(PERF_TICKETS)]
+            # As older versions stored them
+            for start in range(0, PERF_TICKETS, 5000):
+                await db.tickets.insert_many([{**t, "created_at": t["created_at"].isoformat()} for t in tickets[start:start + 5000]])
+            monkeypatch.setattr(server.datetime_migration, "_done", False)
+            strings = await measure(db, {"$substr": ["$created_at", 0, 10]})
+            assert await server.convert_timestamps("tickets", "created_at") == PERF_TICKETS
+            monkeypatch.setattr(server.datetime_migration, "_done", True)
+            dates = await measure(db, {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}})
+            return strings, dates
+
+    strings, dates = asyncio.run(scenario())
+    report(f"ISO string timestamps (migration pending), {PERF_TICKETS} tickets", strings["timings"])
+    report(f"BSON date timestamps (migration done), {PERF_TICKETS} tickets", dates["timings"])
+    assert strings["count"] == dates["count"]
+    assert strings["volume"] == dates["volume"]
+    assert strings["pages"] == dates["pages"]
@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime, timezone
+
+import server
+from tests.perf.common import PERF_TICKETS, perf_database, report, seed_tickets, timed
+
+
+async def counted_kpi(db) -> dict:
+    # What GET /kpi did before the rollups: one count per tile plus an aggregation for the response time
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    avg = await db.tickets.aggregate([
+        {"$match": {"first_response_at": {"$ne": None}, "claimed_at": {"$ne": None}}},
+        {"$group": {"_id": None, "avg": {"$avg": {"$divide": [{"$subtract": ["$first_response_at", "$claimed_at"]}, 60000]}}}}
+    ]).to_list(1)
+    return {
+        "total_tickets": await db.tickets.count_documents({}),
+        "open_tickets": await db.tickets.count_documents({"status": {"$in": list(server.OPEN_STATUSES)}}),
+        "closed_today": await db.tickets.count_documents({"status": "closed", "closed_at": {"$gte": today}}),
+        "escalated": await db.tickets.count_documents({"status": "escalated"}),
+        "sla_breached": await db.tickets.count_documents({"sla_breached": True, "status": {"$ne": "closed"}}),
+        "avg_response_time_min": round(avg[0]["avg"], 1) if avg and avg[0].get("avg") else 0,
+    }
+
+
+def test_kpi_from_rollups(monkeypatch):
+    async def scenario():
+        async with perf_database(monkeypatch) as db:
+            await seed_tickets(db)
+            await server.build_rollups()
+            assert await server.compute_kpi() == await counted_kpi(db)
+            return {
+                "counted (one query per tile)": await timed(lambda: counted_kpi(db)),
+                "rollups (compute_kpi)": await timed(server.compute_kpi),
+            }
+
+    results = asyncio.run(scenario())
+    report(f"GET /kpi on a cache miss, {PERF_TICKETS} tickets", results)
+    assert results["rollups (compute_kpi)"]["p50"] < results["counted (one query per tile)"]["p50"]
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+import uuid
+
+import bcrypt
+import pytest
+
+import server
+from tests.perf.common import perf_database, report, summarize
+
+httpx = pytest.importorskip("httpx")
+
+STORM_LOGINS = int(os.environ.get("PERF_STORM_LOGINS", "30"))
+
+
+async def inline_password_work(fn, *args):
+    # bcrypt on the event loop, as before the password pool
+    return fn(*args)
+
+
+async def login_storm() -> dict:
+    # STORM_LOGINS concurrent failed logins while /api/health is probed every 10ms
+    latencies = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://panel") as http:
+        done = asyncio.Event()
+
+        async def probe():
+            # Measured from when the probe was due, so time the loop spent blocked counts
+            due = time.perf_counter()
+            while True:
+                await http.get("/api/health")
+                latencies.append((time.perf_counter() - due) * 1000)
+                if done.is_set():
+                    break
+                due = time.perf_counter() + 0.01
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(http.post("/api/auth/login", json={"username": "alice", "password": "wrong"})
+                                           for _ in range(STORM_LOGINS)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+    assert {r.status_code for r in responses} == {401}
+    return {**summarize(latencies), "probes": len(latencies), "seconds": elapsed}
+
+
+def test_login_storm_keeps_the_loop_responsive(monkeypatch):
+    monkeypatch.setattr(server.login_user_limiter, "limit", 10 ** 6)
+    monkeypatch.setattr(server.login_ip_limiter, "limit", 10 ** 6)
+    monkeypatch.setattr(server, "PASSWORD_MAX_PENDING", STORM_LOGINS)
+
+    async def scenario():
+        async with perf_database(monkeypatch) as db:
+            await db.panel_users.insert_one({"id": str(uuid.uuid4()), "username": "alice", "role": "support",
+                                             "password_hash": bcrypt.hashpw(b"secret", bcrypt.gensalt()).decode()})
+            pooled = await login_storm()
+            with monkeypatch.context() as inline:
+                inline.setattr(server, "run_password_work", inline_password_work)
+                blocking = await login_storm()
+            return {"bcrypt on the event loop": blocking, "bcrypt in the password pool": pooled}
+
+    results = asyncio.run(scenario())
+    report(f"/api/health latency during {STORM_LOGINS} concurrent failed logins", results)
+    for name, stats in results.items():
+        print(f"  {name:<28} {stats['probes']} probes in {stats['seconds']:.1f}s")
+    assert results["bcrypt in the password pool"]["probes"] > results["bcrypt on the event loop"]["probes"]
+    assert results["bcrypt in the password pool"]["max"] < results["bcrypt on the event loop"]["max"]
@@ -0,0 +1,35 @@
+import asyncio
+import re
+
+import server
+from tests.perf.common import PERF_TICKETS, perf_database, report, seed_tickets, timed
+
+QUERIES = {"word": "webhook", "two words": "music backup", "prefix": "perm", "no match": "zzzz"}
+
+
+async def regex_search(db, q: str) -> list:
+    # The search before the text and prefix indexes: four unanchored case-insensitive regexes
+    pattern = re.escape(q)
+    query = {"$or": [{field: {"$regex": pattern, "$options": "i"}} for field in ("subject", "username", "description", "id")]}
+    return await db.tickets.find(query, {"_id": 0}).limit(20).to_list(20)
+
+
+def test_search_with_text_and_prefix_indexes(monkeypatch):
+    async def scenario():
+        async with perf_database(monkeypatch) as db:
+            tickets = await seed_tickets(db)
+            # Id lookups need a digit in the prefix; anything else is searched as text
+            shown_id = next(t["id"][:8] for t in tickets[PERF_TICKETS // 2:] if any(c.isdigit() for c in t["id"][:8]))
+            queries = {**QUERIES, "id prefix": f"#{shown_id}"}
+            results = {}
+            for name, q in queries.items():
+                found = (await server.search_tickets(q=q, user={}))["results"]
+                assert bool(found) == (name != "no match"), name
+                results[f"regex: {name}"] = await timed(lambda: regex_search(db, q))
+                results[f"indexed: {name}"] = await timed(lambda: server.search_tickets(q=q, user={}))
+            return results
+
+    results = asyncio.run(scenario())
+    report(f"GET /search, {PERF_TICKETS} tickets", results)
+    # Without a match the regexes read every ticket; the indexes answer from a few keys
+    assert results["indexed: no match"]["p50"] < results["regex: no match"]["p50"]
@@ -0,0 +1,29 @@
+import os
+import time
+
+import server
+
+TOKEN_CALLS = int(os.environ.get("PERF_TOKEN_CALLS", "20000"))
+
+
+def per_call_us(fn) -> float:
+    start = time.perf_counter()
+    for _ in range(TOKEN_CALLS):
+        fn()
+    return (time.perf_counter() - start) / TOKEN_CALLS * 1e6
+
+
+def test_verified_token_cache(monkeypatch):
+    # CPU only: no database involved, so this one always runs
+    monkeypatch.setattr(server.revocations, "loaded_at", float("inf"))
+    token = server.create_token("user-1", "alice", "support")
+
+    def verify_every_time():
+        server.token_cache.entries.clear()
+        return server.decode_token(token)
+
+    uncached = per_call_us(verify_every_time)
+    cached = per_call_us(lambda: server.decode_token(token))
+    print(f"\ndecode_token over {TOKEN_CALLS} calls: {uncached:.1f} us verifying, {cached:.1f} us on a cache hit")
+    assert server.decode_token(token)["sub"] == "user-1"
+    assert cached < uncached
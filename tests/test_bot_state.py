@@ -0,0 +1,42 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+from pymongo.errors import PyMongoError
+
+import server
+
+
+def test_counter_request_is_applied_once(monkeypatch):
+    # Needs a real server: the counter's pipeline update is beyond in-memory mocks
+    async def scenario():
+        client = motor_asyncio.AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+        try:
+            await client.admin.command("ping")
+        except PyMongoError as e:
+            client.close()
+            pytest.skip(f"No MongoDB server at MONGO_URL: {e}")
+        name = f"bot_state_{uuid.uuid4().hex[:8]}"
+        monkeypatch.setattr(server, "db", client[name])
+        try:
+            await server.db.counters.create_index("name", unique=True)
+            change = server.BotStateCounter(increment=1, request_id="first")
+            values = [
+                (await server.bot_state_counter("ticket", change))["value"],
+                # The retry of a request whose response was lost
+                (await server.bot_state_counter("ticket", change))["value"],
+                (await server.bot_state_counter("ticket", server.BotStateCounter(increment=1, request_id="second")))["value"],
+            ]
+            retries = await asyncio.gather(*(server.bot_state_counter("ticket", server.BotStateCounter(increment=1, request_id="third"))
+                                             for _ in range(5)))
+            return values, {r["value"] for r in retries}
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    values, retried = asyncio.run(scenario())
+    assert values == [1, 1, 2]
+    assert retried == {3}
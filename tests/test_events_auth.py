@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import server
+
+
+def request(query: str = "", headers: dict = None) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/api/events", "query_string": query.encode(),
+                    "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]})
+
+
+def test_event_stream_requires_a_token(monkeypatch):
+    monkeypatch.setattr(server.revocations, "loaded_at", float("inf"))
+    monkeypatch.setattr(server, "DISCORD_BOT_TOKEN", "bot-secret")
+    token = server.create_token("user-1", "alice", "support")
+
+    with pytest.raises(HTTPException) as missing:
+        asyncio.run(server.stream_user(request()))
+    with pytest.raises(HTTPException) as forged:
+        asyncio.run(server.stream_user(request(), token="not-a-jwt"))
+    with pytest.raises(HTTPException):
+        asyncio.run(server.stream_user(request(headers={"X-Bot-Token": "guess"})))
+    assert missing.value.status_code == forged.value.status_code == 401
+    assert asyncio.run(server.stream_user(request(), token=token))["sub"] == "user-1"
+    assert asyncio.run(server.stream_user(request(headers={"Authorization": f"Bearer {token}"})))["sub"] == "user-1"
+    assert asyncio.run(server.stream_user(request(headers={"X-Bot-Token": "bot-secret"})))["role"] == "bot"
+
+
+def test_revoked_user_stream_is_closed():
+    async def scenario():
+        alice, bob = server.SSEClient(user_id="user-1"), server.SSEClient(user_id="user-2")
+        for client in (alice, bob):
+            client.offer({"id": "1", "event_type": "user_revoked", "data": {"user_id": "user-1"}})
+        return alice.closed, bob.closed
+
+    assert asyncio.run(scenario()) == (True, False)
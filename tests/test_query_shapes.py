@@ -0,0 +1,51 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+from pymongo.errors import PyMongoError
+
+import server
+
+
+def test_catalogued_query_shapes_use_an_index(monkeypatch):
+    async def scenario():
+        client = motor_asyncio.AsyncIOMotorClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+        try:
+            await client.admin.command("ping")
+        except PyMongoError as e:
+            client.close()
+            pytest.skip(f"No MongoDB server at MONGO_URL: {e}")
+        name = f"query_shapes_{uuid.uuid4().hex[:8]}"
+        monkeypatch.setattr(server, "db", client[name])
+        try:
+            # Explaining against missing collections yields EOF plans, so create them with their indexes
+            await server.ensure_indexes()
+            return await server.explain_query_shapes()
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    report = asyncio.run(scenario())
+    scans = [f"{entry['endpoint']} ({entry['collection']})" for entry in report if entry["collscan"]]
+    assert not scans, f"Query shapes planned as COLLSCAN: {', '.join(scans)}"
+
+
+def test_uncatalogued_indexes_are_dropped(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)["index_reconcile_test"]
+        monkeypatch.setattr(server, "db", db)
+        # Indexes created by older versions
+        await db.tickets.create_index("status")
+        await db.tickets.create_index("created_at")
+        await db.live_events.create_index("timestamp")
+        await server.ensure_indexes()
+        return {name: set(await db[name].index_information()) for name in ("tickets", "live_events")}
+
+    indexes = asyncio.run(scenario())
+    for collection, names in indexes.items():
+        assert names == {"_id_"} | {index.document["name"] for index in server.INDEX_CATALOGUE[collection]}
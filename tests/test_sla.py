@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server
+
+SUPPORTER = {"username": "alice", "role": "support"}
+
+
+def ticket(**fields):
+    now = datetime.now(timezone.utc)
+    return {"id": "t1", "status": "open", "priority": "medium", "subject": "Refund", "created_at": now,
+            "first_response_at": None, "closed_at": None, "sla_breached": False, "version": 0,
+            "sla_due_at": now + timedelta(days=1), **fields}
+
+
+def run(monkeypatch, doc, scenario):
+    async def main():
+        db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)["sla_test"]
+        monkeypatch.setattr(server, "db", db)
+        monkeypatch.setattr(server, "event_bus", server.MemoryEventBus())
+        await server.event_bus.start(server.deliver_events)
+        server.settings_cache.set(server.PanelSettings(sla_first_response=30, sla_resolution=240))
+        await db.tickets.insert_one(dict(doc))
+        await scenario()
+        return await db.tickets.find_one({"id": doc["id"]}, {"_id": 0})
+
+    return asyncio.run(main())
+
+
+def test_claim_after_deadline_is_a_breach(monkeypatch):
+    # The engine never saw the ticket overdue (its sla_due_at is still ahead), but the claim came too late
+    doc = ticket(created_at=datetime.now(timezone.utc) - timedelta(hours=1))
+    stored = run(monkeypatch, doc, lambda: server.claim_ticket("t1", SUPPORTER))
+    assert stored["status"] == "claimed"
+    assert stored["sla_breached"] is True
+
+
+def test_claim_in_time_is_not_a_breach(monkeypatch):
+    stored = run(monkeypatch, ticket(), lambda: server.claim_ticket("t1", SUPPORTER))
+    assert stored["sla_breached"] is False
+
+
+def test_late_close_is_a_breach(monkeypatch):
+    now = datetime.now(timezone.utc)
+    doc = ticket(status="claimed", claimed_by="alice", created_at=now - timedelta(hours=5),
+                 first_response_at=now - timedelta(hours=5) + timedelta(minutes=5))
+    stored = run(monkeypatch, doc, lambda: server.close_ticket("t1", SUPPORTER))
+    assert stored["status"] == "closed"
+    assert stored["sla_breached"] is True
+
+
+def test_engine_flags_claim_made_while_it_was_down(monkeypatch):
+    now = datetime.now(timezone.utc)
+    doc = ticket(status="claimed", claimed_by="alice", created_at=now - timedelta(hours=2),
+                 first_response_at=now - timedelta(minutes=30), sla_due_at=now - timedelta(hours=1, minutes=30))
+    stored = run(monkeypatch, doc, server.run_sla_checks)
+    assert stored["sla_breached"] is True
+    assert stored["sla_due_at"] is None
@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server
+
+ALICE = {"username": "alice", "role": "support"}
+BOB = {"username": "bob", "role": "support"}
+
+
+def run(monkeypatch, ticket, scenario):
+    events = []
+
+    async def main():
+        db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)["transitions_test"]
+        monkeypatch.setattr(server, "db", db)
+        monkeypatch.setattr(server, "event_bus", server.MemoryEventBus())
+        monkeypatch.setattr(server, "archive_transcript_safely", lambda ticket_id: asyncio.sleep(0))
+
+        async def record(published):
+            events.extend(e["event_type"] for e in published)
+
+        await server.event_bus.start(record)
+        await db.tickets.insert_one({"id": "t1", "subject": "Refund", "priority": "medium", "version": 0,
+                                     "created_at": datetime.now(timezone.utc), "sla_breached": False, **ticket})
+        return await scenario()
+
+    return asyncio.run(main()), events
+
+
+def test_closing_a_closed_ticket_returns_it_unchanged(monkeypatch):
+    async def scenario():
+        first = await server.close_ticket("t1", ALICE)
+        second = await server.close_ticket("t1", ALICE)
+        return first, second
+
+    (first, second), events = run(monkeypatch, {"status": "open"}, scenario)
+    assert second["status"] == "closed"
+    assert second["version"] == first["version"]
+    assert second["ticket"]["closed_by"] == "alice"
+    assert events == ["ticket_close"]
+
+
+def test_claimed_ticket_without_supporter_can_be_claimed(monkeypatch):
+    result, events = run(monkeypatch, {"status": "claimed", "claimed_by": None},
+                         lambda: server.claim_ticket("t1", ALICE))
+    assert result["claimed_by"] == "alice"
+    assert events == ["ticket_claim"]
+
+
+def test_claim_is_idempotent_for_the_same_supporter_only(monkeypatch):
+    async def scenario():
+        await server.claim_ticket("t1", ALICE)
+        again = await server.claim_ticket("t1", ALICE)
+        with pytest.raises(HTTPException) as conflict:
+            await server.claim_ticket("t1", BOB)
+        return again, conflict.value.status_code
+
+    (again, status_code), events = run(monkeypatch, {"status": "open"}, scenario)
+    assert again["claimed_by"] == "alice"
+    assert status_code == 409
+    assert events == ["ticket_claim"]
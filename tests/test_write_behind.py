@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+import server
+
+
+def test_partially_written_batch_is_not_retried_forever(monkeypatch):
+    async def scenario():
+        db = mongomock_motor.AsyncMongoMockClient(tz_aware=True)["write_behind_test"]
+        monkeypatch.setattr(server, "db", db)
+        collection = db["audit_log"]
+        insert_many = type(collection).insert_many
+        calls = []
+
+        async def flaky_insert_many(self, docs, ordered=True):
+            # The first attempt stores the batch, then the connection drops before the reply
+            calls.append(len(docs))
+            result = await insert_many(self, docs, ordered=ordered)
+            if len(calls) == 1:
+                raise AutoReconnect("connection reset")
+            return result
+
+        monkeypatch.setattr(type(collection), "insert_many", flaky_insert_many)
+        buffer = server.WriteBehindBuffer(lambda doc: "audit_log")
+        buffer.pending = [{"id": str(i)} for i in range(4)]
+
+        with pytest.raises(AutoReconnect):
+            await buffer.flush()
+        assert len(buffer.pending) == 4
+
+        await buffer.flush()
+        assert buffer.pending == []
+        assert buffer.written == 4
+        assert await collection.count_documents({}) == 4
+
+    asyncio.run(scenario())